@@ -1,197 +1,105 @@
-import os
 import sys
-import time
-import traceback
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from typing import Any, Dict
-from json_environ import Environ
-from algosdk.future import transaction
-from algofi_amm.v0.asset import Asset
+from itertools import combinations, permutations, product
+from typing import Any, Dict, Tuple
 from src.classes.account import Account
 from src.classes.asset import AlgoAsset, SwapAmount
+from src.classes.exceptions import SwapFailedError
 
-from src.helpers import get_algofi_swap_amount_out_scaled, get_amm_clients, get_asset_details, \
-    get_highest_swap_amount_out, get_liquidity_pools, get_network, get_pact_swap_amount_out_scaled, \
-    is_algofi_nanoswap_stable_asset_pair
+from src.bots.common import NodeFailover, env, get_supported_assets, network, submit_swap
+from src.helpers import get_all_pool_reserves, get_highest_swap_amount_out, get_liquidity_pools_batched, \
+    get_optimal_cycle_amounts, wait_for_new_round, VERBOSE
 
-network = get_network()
-file_path = os.path.abspath(os.path.dirname(__file__))
-env_path = os.path.join(file_path, f"../../env/env-{network}.json")
-env = Environ(path=env_path)
+# Trading parameters are read from the config once rather than on every round trip.
+SLIPPAGE = float(env("arbitrage:threeway:amounts:slippage"))
+MIN_PROFIT = Decimal(env("arbitrage:threeway:amounts:min_profit"))
+
+# The first-leg quotes for both round trips are independent network round-trips to the DEXs, so
+# we fire them off concurrently on this pool instead of one after the other.
+executor = ThreadPoolExecutor(max_workers=2)
 
 
 def get_configured_assets() -> Dict[int, AlgoAsset]:
     asset1_id = env("arbitrage:threeway:assets:asset1_id")
     asset2_id = env("arbitrage:threeway:assets:asset2_id")
     asset3_id = env("arbitrage:threeway:assets:asset3_id")
-    asset_ids = (int(asset1_id), int(asset2_id), int(asset3_id))
 
-    try:
-        assets = get_asset_details(asset_ids)
-        if len(assets) == 3:
-            return assets
-        else:
-            for asset_id in asset_ids:
-                if asset_id not in assets:
-                    print(
-                        f"Sorry, the configured asset ID '{asset_id}' is not supported by this trading bot.")
-                    sys.exit(1)
-    except RuntimeError as e:
-        print(f"Error: {e}")
-        sys.exit(1)
+    return get_supported_assets((int(asset1_id), int(asset2_id), int(asset3_id)))
 
 
-def submit_swap(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, details: SwapAmount, retry_with_new_quote: bool = False):
-    leave_loop = False
-    swap_to_carry_out: SwapAmount = details
-    swap_carried_out: SwapAmount = None
-    slippage = swap_to_carry_out.slippage
+def get_next_leg_swap(amm_clients: Dict[str, Any], lps: Dict[str, Any], planned_swap: SwapAmount, previous_swap: SwapAmount) -> SwapAmount:
+    """Returns the swap to carry out for the next leg of a round trip, given the swap carried out for the previous leg.
 
-    while leave_loop is False:
-        dex = swap_to_carry_out.dex.lower()
-        try:
-            if dex == "algofi":
-                amount_out_with_slippage = swap_to_carry_out.quote["amount_out_with_slippage"]
-                from_asset_id = 1 if swap_to_carry_out.from_asset.asset_onchain_id == 0 else swap_to_carry_out.from_asset.asset_onchain_id
-                swap_input_asset = Asset(amm_clients["algofi"], from_asset_id)
-                swap_asset_scaled_amount = swap_input_asset.get_scaled_amount(
-                    swap_to_carry_out.amount_in)
-
-                to_asset_id = 1 if swap_to_carry_out.to_asset.asset_onchain_id == 0 else swap_to_carry_out.to_asset.asset_onchain_id
-                asset_out = Asset(amm_clients["algofi"], to_asset_id)
-                min_scaled_amount_to_receive = asset_out.get_scaled_amount(
-                    amount_out_with_slippage)
-
-                if is_algofi_nanoswap_stable_asset_pair(from_asset_id, to_asset_id):
-                    swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
-                        account.address, swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=min_scaled_amount_to_receive, fee=5000)
-                else:
-                    swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
-                        account.address, swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=min_scaled_amount_to_receive)
-
-                swap_exact_for_txn.sign_with_private_key(
-                    account.address, account.private_key)
-                result = swap_exact_for_txn.submit(
-                    amm_clients["algofi"].algod, wait=True)
-
-                amt = get_algofi_swap_amount_out_scaled(
-                    result, amm_clients["algofi"], account)
-                if amt is not None:
-                    amount_out = swap_to_carry_out.to_asset.get_unscaled_from_scaled_amount(
-                        amt)
-                else:
-                    amount_out = amount_out_with_slippage
-
-                swap_carried_out = SwapAmount(dex=dex, to_asset=swap_to_carry_out.to_asset, from_asset=swap_to_carry_out.from_asset,
-                                              amount_in=swap_to_carry_out.amount_in, amount_out=amount_out, slippage=slippage,
-                                              amount_out_with_slippage=amount_out_with_slippage, quote=swap_to_carry_out.quote)
-            elif dex == "pact":
-                amount_out_with_slippage = swap_to_carry_out.quote["amount_out_with_slippage"]
-
-                swap_tx_group = swap_to_carry_out.quote["prepared_swap"].prepare_tx_group(
-                    account.getAddress())
-                signed_group = swap_tx_group.sign(account.getPrivateKey())
-                tx_id = amm_clients["pactfi"].algod.send_transactions(
-                    signed_group)
-
-                # wait for confirmation
-                try:
-                    transaction.wait_for_confirmation(
-                        amm_clients["pactfi"].algod, tx_id)
-                except Exception as err:
-                    print(err)
-                    sys.exit(1)
+    The quote we already have for the leg is reused as long as the previous leg produced at least the amount that
+    quote was for (e.g. a Tinyman swap's minimum plus its redeemed excess). The leg then swaps just that amount and
+    anything over it stays in the account. Only when the previous leg produced less do we go back to the DEXs for a
+    fresh quote. If the reused quote has gone stale, submit_swap re-quotes it anyway.
 
-                # Note: We get our indexer.IndexerClient instance from our Algofi client instance because the Pact client
-                # does not store an indexer client instance that we can use.
-                amt = get_pact_swap_amount_out_scaled(
-                    tx_id, amm_clients["algofi"].indexer, account)
-                if amt is not None:
-                    amount_out = swap_to_carry_out.to_asset.get_unscaled_from_scaled_amount(
-                        amt)
-                else:
-                    amount_out = amount_out_with_slippage
-
-                swap_carried_out = SwapAmount(dex=dex, to_asset=swap_to_carry_out.to_asset, from_asset=swap_to_carry_out.from_asset,
-                                              amount_in=swap_to_carry_out.amount_in, amount_out=amount_out, slippage=slippage,
-                                              amount_out_with_slippage=amount_out_with_slippage, quote=swap_to_carry_out.quote)
-            else:
-                amount_out_with_slippage = swap_to_carry_out.quote.amount_out_with_slippage.amount
-                amount_out = amount_out_with_slippage
-                transaction_group = lps["tinyman"].prepare_swap_transactions_from_quote(
-                    swap_to_carry_out.quote)
-                transaction_group.sign_with_private_key(
-                    account.address, account.private_key)
-
-                # Submit transactions to the network and wait for confirmation.
-                amm_clients["tinyman"].submit(transaction_group, wait=True)
-
-                # Check if any excess remains after the swap (it's a Tinyman thing).
-                to_asset_id = 0 if swap_to_carry_out.to_asset.asset_onchain_id == 1 else swap_to_carry_out.to_asset.asset_onchain_id
-                tinyman_asset = amm_clients["tinyman"].fetch_asset(to_asset_id)
-                excess = lps["tinyman"].fetch_excess_amounts()
-
-                if tinyman_asset in excess:
-                    amount = excess[tinyman_asset]
-                    amount_out += amount.amount
-                    print(f'Excess: {amount}')
-
-                    transaction_group = lps["tinyman"].prepare_redeem_transactions(
-                        amount)
-                    transaction_group.sign_with_private_key(
-                        account.address, account.private_key)
-                    amm_clients["tinyman"].submit(transaction_group, wait=True)
-
-                amount_out = swap_to_carry_out.to_asset.get_unscaled_from_scaled_amount(
-                    amount_out)
-                amount_out_with_slippage = swap_to_carry_out.to_asset.get_unscaled_from_scaled_amount(
-                    amount_out_with_slippage)
-
-                swap_carried_out = SwapAmount(dex=dex, to_asset=swap_to_carry_out.to_asset, from_asset=swap_to_carry_out.from_asset,
-                                              amount_in=swap_to_carry_out.amount_in, amount_out=amount_out, slippage=slippage,
-                                              amount_out_with_slippage=amount_out_with_slippage, quote=swap_to_carry_out.quote)
-
-            leave_loop = True
-        except Exception as e:
-            if retry_with_new_quote:
-                lps = get_liquidity_pools(
-                    amm_clients, swap_to_carry_out.from_asset.asset_onchain_id, swap_to_carry_out.to_asset.asset_onchain_id)
-                swap_to_carry_out = get_highest_swap_amount_out(amm_clients, lps, swap_to_carry_out.from_asset,
-                                                                swap_to_carry_out.to_asset, swap_to_carry_out.amount_in, slippage)
-            else:
-                leave_loop = True
+    Parameters:
+    amm_clients (Dict[str, Any]): Dictionary mapping of AMM Clients for each supported DEX
+    lps (Dict[str, Any]): Dictionary mapping of the LPs for the leg's asset pair
+    planned_swap (SwapAmount): The quote for the leg that was got before the round trip started
+    previous_swap (SwapAmount): The swap that was carried out for the previous leg
+
+    Returns:
+    SwapAmount
+    """
+    if previous_swap.amount_out_scaled >= planned_swap.from_asset.get_scaled_amount(planned_swap.amount_in):
+        return planned_swap
 
-    return swap_carried_out
+    return get_highest_swap_amount_out(amm_clients, lps, planned_swap.from_asset, planned_swap.to_asset,
+                                       previous_swap.amount_out, SLIPPAGE)
 
 
-def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_clients: Dict[str, Any],
-                         trade_amt: Decimal, a1: int, a2: int, a3: int, price_action_enabled: bool) -> bool:
+def submit_swap_and_requote_next_leg(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, details: SwapAmount,
+                                     retry_with_new_quote: bool, next_lps: Dict[str, Any], next_swap: SwapAmount):
+    """Submits a swap and, while we wait for it to be confirmed, refreshes the quote for the next leg of the round trip.
+
+    Waiting for a swap to be confirmed takes a few seconds, so the next leg's quote is refreshed in the meantime
+    (for the amount the swap was quoted to produce) instead of the bot sitting idle.
+
+    Parameters:
+    amm_clients (Dict[str, Any]): Dictionary mapping of AMM Clients for each supported DEX
+    lps (Dict[str, Any]): Dictionary mapping of the LPs for the swap's asset pair
+    account (Account): The account to carry out the swap with
+    details (SwapAmount): The swap to carry out
+    retry_with_new_quote (bool): Passed on to submit_swap
+    next_lps (Dict[str, Any]): Dictionary mapping of the LPs for the next leg's asset pair
+    next_swap (SwapAmount): The quote we currently have for the next leg
+
+    Returns:
+    Tuple[SwapAmount, SwapAmount]: The swap carried out (None if it could not be carried out), and the
+                                   refreshed quote for the next leg (or `next_swap` if it could not be refreshed).
+    """
+    submission = executor.submit(submit_swap, amm_clients, lps, account, details, retry_with_new_quote)
+    requote = executor.submit(get_highest_swap_amount_out, amm_clients, next_lps, next_swap.from_asset,
+                              next_swap.to_asset, next_swap.amount_in, SLIPPAGE)
+    swap_carried_out = submission.result()
+
+    try:
+        next_swap = requote.result()
+    except Exception as e:
+        print(f"Unable to refresh quote for the next swap, sticking with the one we have: {e}")
+
+    return swap_carried_out, next_swap
+
+
+def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_clients: Dict[str, Any], trade_amt: Decimal,
+                         a1: int, a2: int, a3: int, pools: Dict[Tuple[int, int], Dict[str, Any]], swap_amount_1: SwapAmount,
+                         price_action_enabled: bool) -> bool:
     asset_ids = [key for key in assets.keys()]
-    slippage = float(env("arbitrage:threeway:amounts:slippage"))
-    amount_in = trade_amt
-    min_profit = Decimal(env("arbitrage:threeway:amounts:min_profit"))
+    swap1_pools = pools[tuple(sorted((a1, a2)))]
+    swap2_pools = pools[tuple(sorted((a2, a3)))]
+    swap3_pools = pools[tuple(sorted((a1, a3)))]
     from_decimals = assets[asset_ids[a1]].decimals
     from_asset_code = assets[asset_ids[a1]].asset_code
     to_decimals = assets[asset_ids[a2]].decimals
     to_asset_code = assets[asset_ids[a2]].asset_code
 
-    print("Fetching liquidity pools (LPs) for each token pair that's possible with the configured assets...")
-    swap1_pools = get_liquidity_pools(
-        amm_clients, asset_ids[a1], asset_ids[a2])
-    swap2_pools = get_liquidity_pools(
-        amm_clients, asset_ids[a2], asset_ids[a3])
-    swap3_pools = get_liquidity_pools(
-        amm_clients, asset_ids[a1], asset_ids[a3])
-    print("LPs fetched successfully.")
-
-    print(
-        f"Getting swap quote from DEXs for {amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}\n")
-
-    swap_amount_1 = get_highest_swap_amount_out(
-        amm_clients, swap1_pools, assets[asset_ids[a1]], assets[asset_ids[a2]], amount_in, slippage)
-
-    print(f"Higher swap amount quoted at the {swap_amount_1.dex} DEX at {swap_amount_1.amount_out:.{to_decimals}f} "
-          f"({swap_amount_1.amount_out_with_slippage:.{to_decimals}f} with slippage) {to_asset_code} for {amount_in:.{from_decimals}f} {from_asset_code}.\n")
+    if VERBOSE:
+        print(f"Higher swap amount quoted at the {swap_amount_1.dex} DEX at {swap_amount_1.amount_out:.{to_decimals}f} "
+              f"({swap_amount_1.amount_out_with_slippage:.{to_decimals}f} with slippage) {to_asset_code} for {trade_amt:.{from_decimals}f} {from_asset_code}.\n")
 
     amount_in = swap_amount_1.amount_out
     from_decimals = to_decimals
@@ -199,14 +107,16 @@ def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_cli
     to_decimals = assets[asset_ids[a3]].decimals
     to_asset_code = assets[asset_ids[a3]].asset_code
 
-    print(
-        f"Getting swap quote from DEXs for {amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}\n")
+    if VERBOSE:
+        print(
+            f"Getting swap quote from DEXs for {amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}\n")
 
     swap_amount_2 = get_highest_swap_amount_out(
-        amm_clients, swap2_pools, assets[asset_ids[a2]], assets[asset_ids[a3]], amount_in, slippage)
+        amm_clients, swap2_pools, assets[asset_ids[a2]], assets[asset_ids[a3]], amount_in, SLIPPAGE)
 
-    print(f"Higher swap amount quoted at the {swap_amount_2.dex} DEX at {swap_amount_2.amount_out:.{to_decimals}f} "
-          f"({swap_amount_2.amount_out_with_slippage:.{to_decimals}f} with slippage) {to_asset_code} for {amount_in:.{from_decimals}f} {from_asset_code}.\n")
+    if VERBOSE:
+        print(f"Higher swap amount quoted at the {swap_amount_2.dex} DEX at {swap_amount_2.amount_out:.{to_decimals}f} "
+              f"({swap_amount_2.amount_out_with_slippage:.{to_decimals}f} with slippage) {to_asset_code} for {amount_in:.{from_decimals}f} {from_asset_code}.\n")
 
     amount_in = swap_amount_2.amount_out
     from_decimals = to_decimals
@@ -214,22 +124,27 @@ def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_cli
     to_decimals = assets[asset_ids[a1]].decimals
     to_asset_code = assets[asset_ids[a1]].asset_code
 
-    print(
-        f"Getting swap quote from DEXs for {amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}\n")
+    if VERBOSE:
+        print(
+            f"Getting swap quote from DEXs for {amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}\n")
 
     swap_amount_3 = get_highest_swap_amount_out(
-        amm_clients, swap3_pools, assets[asset_ids[a3]], assets[asset_ids[a1]], amount_in, slippage)
+        amm_clients, swap3_pools, assets[asset_ids[a3]], assets[asset_ids[a1]], amount_in, SLIPPAGE)
 
-    print(f"Higher swap amount quoted at the {swap_amount_3.dex} DEX at {swap_amount_3.amount_out:.{to_decimals}f} "
-          f"({swap_amount_3.amount_out_with_slippage:.{to_decimals}f} with slippage) {to_asset_code} for {amount_in:.{from_decimals}f} {from_asset_code}.\n")
+    if VERBOSE:
+        print(f"Higher swap amount quoted at the {swap_amount_3.dex} DEX at {swap_amount_3.amount_out:.{to_decimals}f} "
+              f"({swap_amount_3.amount_out_with_slippage:.{to_decimals}f} with slippage) {to_asset_code} for {amount_in:.{from_decimals}f} {from_asset_code}.\n")
 
-    if swap_amount_3.amount_out >= (trade_amt + min_profit):
+    # The profit check is done on the first asset's base units, which is what the DEX quoted us.
+    min_amount_out_scaled = assets[asset_ids[a1]].get_scaled_amount(trade_amt + MIN_PROFIT)
+
+    if swap_amount_3.amount_out_scaled >= min_amount_out_scaled:
         print(f"Arbitrage condition met. Submitting transactions...")
         print(f"Performing first swap via the {swap_amount_1.dex} DEX for "
               f"{swap_amount_1.amount_in:.{swap_amount_1.from_asset.decimals}f} {swap_amount_1.from_asset.asset_code} "
               f"to {swap_amount_1.to_asset.asset_code}")
-        swap_carried_out = submit_swap(
-            amm_clients, swap1_pools, account, swap_amount_1, False)
+        swap_carried_out, swap_amount_2 = submit_swap_and_requote_next_leg(
+            amm_clients, swap1_pools, account, swap_amount_1, False, swap2_pools, swap_amount_2)
 
         if swap_carried_out is None:
             print(
@@ -237,8 +152,8 @@ def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_cli
             return False
         else:
             print("")
-            swap_to_carry_out = get_highest_swap_amount_out(
-                amm_clients, swap2_pools, assets[asset_ids[a2]], assets[asset_ids[a3]], swap_carried_out.amount_out, slippage)
+            swap_to_carry_out = get_next_leg_swap(
+                amm_clients, swap2_pools, swap_amount_2, swap_carried_out)
             from_decimals = swap_to_carry_out.from_asset.decimals
             from_asset_code = swap_to_carry_out.from_asset.asset_code
             to_asset_code = swap_to_carry_out.to_asset.asset_code
@@ -246,15 +161,15 @@ def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_cli
             print(f"Performing second swap via the {swap_to_carry_out.dex} DEX for "
                   f"{swap_to_carry_out.amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}")
 
-            swap_carried_out = submit_swap(
-                amm_clients, swap2_pools, account, swap_to_carry_out, True)
-
-            if swap_carried_out is None:
-                print("Unable to perform swap. Terminating bot.\n")
+            try:
+                swap_carried_out, swap_amount_3 = submit_swap_and_requote_next_leg(
+                    amm_clients, swap2_pools, account, swap_to_carry_out, True, swap3_pools, swap_amount_3)
+            except SwapFailedError as e:
+                print(f"{e}\nUnable to perform swap. Terminating bot.\n")
                 sys.exit(1)
             else:
-                swap_to_carry_out = get_highest_swap_amount_out(
-                    amm_clients, swap3_pools, assets[asset_ids[a3]], assets[asset_ids[a1]], swap_carried_out.amount_out, slippage)
+                swap_to_carry_out = get_next_leg_swap(
+                    amm_clients, swap3_pools, swap_amount_3, swap_carried_out)
                 from_decimals = swap_to_carry_out.from_asset.decimals
                 from_asset_code = swap_to_carry_out.from_asset.asset_code
                 to_asset_code = swap_to_carry_out.to_asset.asset_code
@@ -262,11 +177,10 @@ def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_cli
                 print(f"Performing third swap via the {swap_to_carry_out.dex} DEX for "
                       f"{swap_to_carry_out.amount_in:.{from_decimals}f} {from_asset_code} to {to_asset_code}")
 
-                swap_carried_out = submit_swap(
-                    amm_clients, swap3_pools, account, swap_to_carry_out, True)
-
-                if swap_carried_out is None:
-                    print("Unable to perform swap. Terminating bot.\n")
+                try:
+                    submit_swap(amm_clients, swap3_pools, account, swap_to_carry_out, True)
+                except SwapFailedError as e:
+                    print(f"{e}\nUnable to perform swap. Terminating bot.\n")
                     sys.exit(1)
 
             return True
@@ -275,15 +189,88 @@ def do_round_trip_helper(account: Account, assets: Dict[int, AlgoAsset], amm_cli
         return False
 
 
+def get_round_trip_amount_in(assets: Dict[int, AlgoAsset], pools: Dict[Tuple[int, int], Dict[str, Any]],
+                             round_trip: Tuple[int, ...], max_trade_amt: Decimal) -> Decimal | None:
+    """Works out how much of the first asset to put into a round trip.
+
+    Each leg is swapped through a single LP, so every choice of one LP per leg is tried and the amount that makes
+    the most profit through any of them is used, capped at the configured trade amount. The configured trade amount
+    is used as is if the reserves of any LP on any leg aren't known. If the reserves show that even the most
+    profitable amount can't make the minimum profit whichever LPs are used, None is returned so the round trip
+    can be skipped without asking the DEXs for quotes.
+
+    Parameters:
+    assets (Dict[int, AlgoAsset]): The configured assets
+    pools (Dict[Tuple[int, int], Dict[str, Any]]): LPs for each pair of (indexes of) the configured assets
+    round_trip (Tuple[int, ...]): Indexes of the assets in the order the round trip goes through them
+    max_trade_amt (Decimal): The configured trade amount
+
+    Returns:
+    Decimal | None
+    """
+    asset_ids = [key for key in assets.keys()]
+    start_asset = assets[asset_ids[round_trip[0]]]
+    leg_reserves = []
+
+    for from_index, to_index in zip(round_trip, round_trip[1:] + round_trip[:1]):
+        reserves = get_all_pool_reserves(pools[tuple(sorted((from_index, to_index)))], asset_ids[from_index])
+        if reserves is None:
+            return max_trade_amt
+        leg_reserves.append(reserves)
+
+    optimal_amt_scaled, optimal_profit_scaled = Decimal(0), Decimal(0)
+    for legs in product(*leg_reserves):
+        amt_scaled, amt_out_scaled = get_optimal_cycle_amounts(list(legs))
+        if amt_out_scaled - amt_scaled > optimal_profit_scaled:
+            optimal_amt_scaled, optimal_profit_scaled = amt_scaled, amt_out_scaled - amt_scaled
+
+    if optimal_amt_scaled <= 0 or optimal_profit_scaled < start_asset.get_scaled_amount(MIN_PROFIT):
+        return None
+
+    return min(max_trade_amt, start_asset.get_unscaled_from_scaled_amount(int(optimal_amt_scaled)))
+
+
 def do_round_trip(account: Account, assets: Dict[int, AlgoAsset], amm_clients: Dict[str, Any], trade_amt: Decimal, price_action_enabled: bool):
-    # First round trip is Asset 1 -> Asset 2, Asset 2 -> Asset 3, Asset 3 -> Asset 1
-    # If this results in a profit made on Asset 1 then we're good, otherwise let's try the
-    # alternative round trip, which is Asset 1 -> Asset 3, Asset 3 -> Asset 2, Asset 2 -> Asset 1.
-    arbitrage_fullfilled = do_round_trip_helper(
-        account, assets, amm_clients, trade_amt, 0, 1, 2, price_action_enabled)
-    if not arbitrage_fullfilled:
-        do_round_trip_helper(account, assets, amm_clients,
-                             trade_amt, 0, 2, 1, price_action_enabled)
+    # Every round trip starts and ends at Asset 1 and goes through each of the other assets once, so
+    # with three assets there are two of them: Asset 1 -> Asset 2 -> Asset 3 -> Asset 1, and
+    # Asset 1 -> Asset 3 -> Asset 2 -> Asset 1. We try them in turn until one results in a profit.
+    # They all go through the same LPs and none of their first legs depend on anything else, so the
+    # LPs and all the first-leg quotes are fetched concurrently up front.
+    asset_ids = [key for key in assets.keys()]
+    asset_codes = [value.asset_code for value in assets.values()]
+    round_trips = [(0,) + path for path in permutations(range(1, len(asset_ids)))]
+
+    if VERBOSE:
+        print("Fetching liquidity pools (LPs) for each token pair that's possible with the configured assets...")
+    pairs = list(combinations(range(len(asset_ids)), 2))
+    lps = get_liquidity_pools_batched(amm_clients, [(asset_ids[i], asset_ids[j]) for i, j in pairs])
+    pools = {(i, j): lps[(asset_ids[i], asset_ids[j])] for i, j in pairs}
+    if VERBOSE:
+        print("LPs fetched successfully.")
+
+    amounts_in = {round_trip: get_round_trip_amount_in(assets, pools, round_trip, trade_amt) for round_trip in round_trips}
+    if VERBOSE:
+        for round_trip in round_trips:
+            if amounts_in[round_trip] is None:
+                path = " -> ".join(asset_codes[index] for index in round_trip + round_trip[:1])
+                print(f"No arbitrage possible for {path} at the LPs' current prices, skipping it.")
+    round_trips = [round_trip for round_trip in round_trips if amounts_in[round_trip] is not None]
+
+    if VERBOSE:
+        for round_trip in round_trips:
+            print(f"Getting swap quote from DEXs for {amounts_in[round_trip]:.{assets[asset_ids[0]].decimals}f} {asset_codes[0]} "
+                  f"to {asset_codes[round_trip[1]]}\n")
+    first_leg_futures = {round_trip: executor.submit(get_highest_swap_amount_out, amm_clients, pools[(0, round_trip[1])],
+                                                     assets[asset_ids[0]], assets[asset_ids[round_trip[1]]],
+                                                     amounts_in[round_trip], SLIPPAGE)
+                         for round_trip in round_trips}
+    first_legs = {round_trip: future.result() for round_trip, future in first_leg_futures.items()}
+
+    for round_trip in round_trips:
+        a1, a2, a3 = round_trip
+        if do_round_trip_helper(account, assets, amm_clients, amounts_in[round_trip], a1, a2, a3, pools, first_legs[round_trip],
+                                price_action_enabled):
+            break
 
 
 def run_bot():
@@ -296,18 +283,22 @@ def run_bot():
     print(f"Configured assets are: {', '.join(asset_codes)}")
 
     print("Instantiating AMM Clients for each supported Algorand DEX...")
-    amm_clients = get_amm_clients(account)
+    failover = NodeFailover(account)
 
     print("Initialization completed. Starting round trip checks for arbitrage...\n")
     enable_price_action = env("arbitrage:threeway:enable_price_action_variant")
     trade_amt = Decimal(env("arbitrage:threeway:amounts:starting_amt"))
 
+    last_round = None
+
     while (True):
         try:
-            do_round_trip(account, assets, amm_clients,
+            do_round_trip(account, assets, failover.amm_clients,
                           trade_amt, enable_price_action)
-            print(
-                "--------------------------------------------------------------------------------\n")
-            time.sleep(2)
+            if VERBOSE:
+                print(
+                    "--------------------------------------------------------------------------------\n")
+            failover.succeeded()
+            last_round = wait_for_new_round(failover.amm_clients["algofi"].algod, last_round)
         except Exception as e:
-            traceback.print_exc()
+            failover.failed(e)
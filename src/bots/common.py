@@ -0,0 +1,236 @@
+import sys
+import time
+import traceback
+from typing import Any, Dict, Tuple
+
+from requests.exceptions import ConnectionError, Timeout
+
+from src.classes.account import Account
+from src.classes.asset import AlgoAsset, SwapAmount
+from src.classes.exceptions import SupportedAssetsLookupError, SwapFailedError
+from src.helpers import env, get_algofi_asset, get_algofi_asset_id, get_algofi_swap_amount_out_scaled, get_amm_clients, \
+    get_asset_details, get_backoff_delay, get_highest_swap_amount_out, get_liquidity_pools, get_network, \
+    get_pact_swap_amount_out_scaled, get_tinyman_asset, get_tinyman_asset_id, is_algofi_nanoswap_stable_asset_pair, \
+    wait_for_transaction_confirmation
+
+# All the bots run against the same network and config file as the helpers, so they share the config the
+# helpers module has already loaded instead of each working out its path and parsing it again.
+network = get_network()
+
+# How many connection errors in a row before a bot switches over to the other algod/indexer node.
+MAX_CONNECTION_ERRORS = 3
+
+
+def get_supported_assets(asset_ids: Tuple[int, ...]) -> Dict[int, AlgoAsset]:
+    """Get the details of the configured assets, exiting the bot if any of them isn't supported.
+
+    Parameters:
+    asset_ids (Tuple[int, ...]): On-chain IDs of the configured assets
+
+    Returns:
+    Dict[int, AlgoAsset]
+    """
+    try:
+        assets = get_asset_details(asset_ids)
+    except (RuntimeError, SupportedAssetsLookupError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    for asset_id in asset_ids:
+        if asset_id not in assets:
+            print(
+                f"Sorry, the configured asset ID '{asset_id}' is not supported by this trading bot. All configured asset IDs must be supported for the bot to run.")
+            sys.exit(1)
+
+    return assets
+
+
+def redeem_tinyman_excess(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, to_asset: AlgoAsset) -> int:
+    """Redeems any excess of the asset out left with Tinyman after a swap and returns how much was redeemed.
+
+    A Tinyman swap only pays out the minimum amount and leaves whatever the pool actually gave over that as excess.
+    That depends on how the price moved before the swap went through (there can be some even with no slippage), so
+    the account's excess has to be looked up after every swap.
+
+    Parameters:
+    amm_clients (Dict[str, Any]): Dictionary mapping of AMM Clients for each supported DEX
+    lps (Dict[str, Any]): Dictionary mapping of the LPs for the swap's asset pair
+    account (Account): The account that carried out the swap
+    to_asset (AlgoAsset): The asset the swap was to
+
+    Returns:
+    int: The amount redeemed, scaled by the asset's decimals (0 if there was no excess)
+    """
+    tinyman_asset = get_tinyman_asset(amm_clients["tinyman"], get_tinyman_asset_id(to_asset.asset_onchain_id))
+    amount = lps["tinyman"].fetch_excess_amounts().get(tinyman_asset)
+
+    if amount is None or amount.amount <= 0:
+        return 0
+
+    print(f'Excess: {amount}')
+    transaction_group = lps["tinyman"].prepare_redeem_transactions(amount)
+    transaction_group.sign_with_private_key(account.address, account.private_key)
+    amm_clients["tinyman"].submit(transaction_group, wait=True)
+
+    return amount.amount
+
+
+def submit_swap(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, details: SwapAmount, retry_with_new_quote: bool = False,
+                max_retries: int = 2, base_backoff: float = 0.2) -> SwapAmount | None:
+    """Carries out a swap and returns the details of what it actually produced.
+
+    If the swap fails and `retry_with_new_quote` is set, it's retried with a fresh quote up to `max_retries` times,
+    waiting a little longer before each retry (`base_backoff` seconds, doubled every time) so prices can settle.
+
+    Parameters:
+    amm_clients (Dict[str, Any]): Dictionary mapping of AMM Clients for each supported DEX
+    lps (Dict[str, Any]): Dictionary mapping of the LPs for the swap's asset pair
+    account (Account): The account to carry out the swap with
+    details (SwapAmount): The swap to carry out
+    retry_with_new_quote (bool): Whether to retry the swap with a fresh quote if it fails
+    max_retries (int): How many times to retry the swap at most
+    base_backoff (float): How long to wait (in seconds) before the first retry
+
+    Returns:
+    SwapAmount | None: The swap carried out, or None if it failed and `retry_with_new_quote` isn't set
+
+    Raises:
+    SwapFailedError: If the swap still failed after the last retry
+    """
+    swap_to_carry_out: SwapAmount = details
+    slippage = swap_to_carry_out.slippage
+
+    # The assets and the amount going in stay the same when the swap is retried with a new quote (only the
+    # DEX and the amounts coming out can change), so everything that depends on them is worked out once.
+    from_asset_id = get_algofi_asset_id(swap_to_carry_out.from_asset.asset_onchain_id)
+    to_asset_id = get_algofi_asset_id(swap_to_carry_out.to_asset.asset_onchain_id)
+    swap_asset_scaled_amount = swap_to_carry_out.from_asset.get_scaled_amount(swap_to_carry_out.amount_in)
+    is_nanoswap_pair = is_algofi_nanoswap_stable_asset_pair(from_asset_id, to_asset_id)
+
+    for attempt in range(max_retries + 1):
+        dex = swap_to_carry_out.dex.lower()
+        amount_out_with_slippage_scaled = swap_to_carry_out.amount_out_with_slippage_scaled
+        try:
+            if dex == "algofi":
+                swap_input_asset = get_algofi_asset(amm_clients["algofi"], from_asset_id)
+
+                if is_nanoswap_pair:
+                    swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
+                        account.address, swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=amount_out_with_slippage_scaled, fee=5000)
+                else:
+                    swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
+                        account.address, swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=amount_out_with_slippage_scaled)
+
+                swap_exact_for_txn.sign_with_private_key(
+                    account.address, account.private_key)
+                swap_exact_for_txn.submit(
+                    amm_clients["algofi"].algod, wait=True)
+
+                amount_out_scaled = get_algofi_swap_amount_out_scaled(
+                    swap_exact_for_txn, amm_clients["algofi"].algod, account)
+            elif dex == "pact":
+                swap_tx_group = swap_to_carry_out.quote["prepared_swap"].prepare_tx_group(
+                    account.address)
+                signed_group = swap_tx_group.sign(account.private_key)
+                tx_id = amm_clients["pactfi"].algod.send_transactions(
+                    signed_group)
+
+                # wait for confirmation
+                try:
+                    wait_for_transaction_confirmation(
+                        amm_clients["pactfi"].algod, tx_id)
+                except Exception as err:
+                    print(err)
+                    sys.exit(1)
+
+                amount_out_scaled = get_pact_swap_amount_out_scaled(
+                    signed_group, amm_clients["pactfi"].algod, account)
+            else:
+                amount_out_scaled = amount_out_with_slippage_scaled
+                transaction_group = lps["tinyman"].prepare_swap_transactions_from_quote(
+                    swap_to_carry_out.quote)
+                transaction_group.sign_with_private_key(
+                    account.address, account.private_key)
+
+                # Submit transactions to the network and wait for confirmation.
+                amm_clients["tinyman"].submit(transaction_group, wait=True)
+
+                # Redeem any excess that remains after the swap (it's a Tinyman thing).
+                amount_out_scaled += redeem_tinyman_excess(amm_clients, lps, account, swap_to_carry_out.to_asset)
+
+            # If we couldn't work out what the swap actually produced, go with the minimum it was
+            # guaranteed to produce.
+            if amount_out_scaled is None:
+                amount_out_scaled = amount_out_with_slippage_scaled
+
+            to_asset = swap_to_carry_out.to_asset
+            return SwapAmount(dex=dex, to_asset=to_asset, from_asset=swap_to_carry_out.from_asset,
+                              amount_in=swap_to_carry_out.amount_in,
+                              amount_out=to_asset.get_unscaled_from_scaled_amount(amount_out_scaled),
+                              amount_out_with_slippage=to_asset.get_unscaled_from_scaled_amount(
+                                  amount_out_with_slippage_scaled),
+                              slippage=slippage, quote=swap_to_carry_out.quote, amount_out_scaled=amount_out_scaled,
+                              amount_out_with_slippage_scaled=amount_out_with_slippage_scaled)
+        except Exception as e:
+            if not retry_with_new_quote:
+                print(f"Error: {e}")
+                return None
+
+            if attempt == max_retries:
+                raise SwapFailedError(swap_to_carry_out.from_asset.asset_code, swap_to_carry_out.to_asset.asset_code,
+                                      max_retries + 1) from e
+
+            print(f"Swap attempt {attempt + 1} failed ({e}), retrying with a new quote...")
+            time.sleep(base_backoff * 2**attempt)
+            lps = get_liquidity_pools(
+                amm_clients, swap_to_carry_out.from_asset.asset_onchain_id, swap_to_carry_out.to_asset.asset_onchain_id)
+            swap_to_carry_out = get_highest_swap_amount_out(amm_clients, lps, swap_to_carry_out.from_asset,
+                                                            swap_to_carry_out.to_asset, swap_to_carry_out.amount_in, slippage)
+
+
+class NodeFailover:
+    """Keeps a bot's AMM clients, backing off after errors and switching the clients over to the backup
+       algod/indexer node (algod.backup_algod and algod.backup_indexer in the config) when the node in use
+       keeps failing to respond.
+    """
+    account: Account
+    amm_clients: Dict[str, Any]
+    failures: int
+    connection_errors: int
+    use_backup_node: bool
+    has_backup_node: bool
+
+    def __init__(self, account: Account) -> None:
+        self.account = account
+        self.amm_clients = get_amm_clients(account)
+        self.failures = 0
+        self.connection_errors = 0
+        self.use_backup_node = False
+        self.has_backup_node = env("algod:backup_algod", default=None) is not None
+
+    def succeeded(self) -> None:
+        self.failures = 0
+        self.connection_errors = 0
+
+    def failed(self, error: Exception) -> None:
+        """Print the error and wait before the bot tries again, switching nodes first if the error means the
+           node in use can't be reached.
+
+        Parameters:
+        error (Exception): The error the bot ran into
+        """
+        traceback.print_exc()
+        self.failures += 1
+
+        if isinstance(error, (ConnectionError, Timeout, TimeoutError)):
+            self.connection_errors += 1
+        else:
+            self.connection_errors = 0
+
+        if self.connection_errors >= MAX_CONNECTION_ERRORS and self.has_backup_node:
+            self.use_backup_node = not self.use_backup_node
+            self.connection_errors = 0
+            print(f"Can't reach the algod node, switching to the {'backup' if self.use_backup_node else 'main'} node...")
+            self.amm_clients = get_amm_clients(self.account, self.use_backup_node)
+
+        time.sleep(get_backoff_delay(self.failures))
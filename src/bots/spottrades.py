@@ -1,21 +1,17 @@
-import os
 import sys
 import time
-from datetime import datetime
+from datetime import datetime, timezone
 from decimal import Decimal
-from json_environ import Environ
-from algosdk.future import transaction
-from algofi_amm.v0.asset import Asset
+from typing import Any, Dict
+from pymongo import ASCENDING, UpdateOne
 from src.classes.account import Account
+from src.classes.asset import AlgoAsset
 
-from src.helpers import get_algofi_swap_amount_out_scaled, get_amm_clients, get_db_client, \
-    get_liquidity_pools, get_network, get_pact_swap_amount_out_scaled, get_supported_algo_assets, \
-    get_swap_quotes, is_algofi_nanoswap_stable_asset_pair
-
-network = get_network()
-file_path = os.path.abspath(os.path.dirname(__file__))
-env_path = os.path.join(file_path, f"../../env/env-{network}.json")
-env = Environ(path=env_path)
+from src.bots.common import env, redeem_tinyman_excess
+from src.helpers import DEX_NAMES, get_algofi_asset, get_algofi_asset_id, get_algofi_swap_amount_out_scaled, \
+    get_amm_clients, get_db_client, get_liquidity_pools, get_pact_swap_amount_out_scaled, \
+    get_quote_amounts_out_scaled, get_supported_algo_assets, \
+    get_swap_quotes, is_algofi_nanoswap_stable_asset_pair, wait_for_transaction_confirmation, VERBOSE
 
 # Get client connection to off-chain DB.
 client = get_db_client()
@@ -23,6 +19,123 @@ if client is None:
     print("Abandoning this run of the Spot Trades (Order Book) bot since connection to the off-chain DB failed")
     sys.exit(1)
 
+# Fields of an order book entry that the bot needs to carry out the order (its _id is always included).
+ORDER_FIELDS = ["order_type", "amt_to_buy_sell", "asset_to_buy_with_sell_to", "asset_to_buy_sell", "slippage",
+                "min_amt_to_receive_per_unit", "max_amt_to_receive_per_unit"]
+
+
+def swap_via_algofi(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, quote: Any, from_asset: AlgoAsset,
+                    to_asset: AlgoAsset, amt_to_buy_sell: Decimal, more_or_less_wording: str) -> Decimal:
+    """Carries out an order's swap via the Algofi DEX and returns the amount of the asset out received."""
+    print("Executing swap via the Algofi DEX...")
+
+    total_asset_out_received = quote["amount_out_with_slippage"]
+    print(
+        f"Swapping {amt_to_buy_sell:.{from_asset.decimals}f} {from_asset.asset_code} for {more_or_less_wording} {total_asset_out_received:.{to_asset.decimals}f} {to_asset.asset_code}")
+
+    from_asset_id = get_algofi_asset_id(from_asset.asset_onchain_id)
+    swap_input_asset = get_algofi_asset(
+        amm_clients["algofi"], from_asset_id)
+    swap_asset_scaled_amount = swap_input_asset.get_scaled_amount(
+        amt_to_buy_sell)
+
+    to_asset_id = get_algofi_asset_id(to_asset.asset_onchain_id)
+    asset_out = get_algofi_asset(amm_clients["algofi"], to_asset_id)
+    min_scaled_amount_to_receive = asset_out.get_scaled_amount(
+        quote["amount_out_with_slippage"])
+
+    if is_algofi_nanoswap_stable_asset_pair(from_asset_id, to_asset_id):
+        swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
+            account.address, swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=min_scaled_amount_to_receive, fee=5000)
+    else:
+        swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
+            account.address, swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=min_scaled_amount_to_receive)
+
+    swap_exact_for_txn.sign_with_private_key(
+        account.address, account.private_key)
+    swap_exact_for_txn.submit(
+        amm_clients["algofi"].algod, wait=True)
+
+    amt = get_algofi_swap_amount_out_scaled(
+        swap_exact_for_txn, amm_clients["algofi"].algod, account)
+    if amt is not None:
+        total_asset_out_received = to_asset.get_unscaled_from_scaled_amount(
+            amt)
+
+    return total_asset_out_received
+
+
+def swap_via_pact(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, quote: Any, from_asset: AlgoAsset,
+                  to_asset: AlgoAsset, amt_to_buy_sell: Decimal, more_or_less_wording: str) -> Decimal:
+    """Carries out an order's swap via the Pact DEX and returns the amount of the asset out received."""
+    print("Executing swap via the Pact DEX...")
+
+    total_asset_out_received = quote["amount_out_with_slippage"]
+    print(
+        f"Swapping {amt_to_buy_sell:.{from_asset.decimals}f} {from_asset.asset_code} for {more_or_less_wording} {total_asset_out_received:.{to_asset.decimals}f} {to_asset.asset_code}")
+
+    # Yo, let's do the swap!
+    swap_tx_group = quote["prepared_swap"].prepare_tx_group(
+        account.address)
+    signed_group = swap_tx_group.sign(
+        account.private_key)
+    tx_id = amm_clients["pactfi"].algod.send_transactions(
+        signed_group)
+
+    # wait for confirmation
+    try:
+        wait_for_transaction_confirmation(
+            amm_clients["pactfi"].algod, tx_id)
+    except Exception as err:
+        print(err)
+        sys.exit(1)
+
+    amt = get_pact_swap_amount_out_scaled(
+        signed_group, amm_clients["pactfi"].algod, account)
+    if amt is not None:
+        total_asset_out_received = to_asset.get_unscaled_from_scaled_amount(
+            amt)
+
+    return total_asset_out_received
+
+
+def swap_via_tinyman(amm_clients: Dict[str, Any], lps: Dict[str, Any], account: Account, quote: Any, from_asset: AlgoAsset,
+                     to_asset: AlgoAsset, amt_to_buy_sell: Decimal, more_or_less_wording: str) -> Decimal:
+    """Carries out an order's swap via the Tinyman DEX and returns the amount of the asset out received."""
+    print("Executing swap via the Tinyman DEX...")
+
+    total_asset_out_received = quote.amount_out_with_slippage.amount
+    print(
+        f"Swapping {amt_to_buy_sell:.{from_asset.decimals}f} {from_asset.asset_code} to {quote.amount_out_with_slippage}")
+
+    # Prepare a transaction group.
+    transaction_group = lps["tinyman"].prepare_swap_transactions_from_quote(
+        quote)
+
+    # Sign the group with the wallet's key.
+    transaction_group.sign_with_private_key(
+        account.address, account.private_key)
+
+    # Submit transactions to the network and wait for confirmation.
+    amm_clients["tinyman"].submit(
+        transaction_group, wait=True)
+
+    # Redeem any excess that remains after the swap.
+    total_asset_out_received += redeem_tinyman_excess(amm_clients, lps, account, to_asset)
+
+    total_asset_out_received = to_asset.get_unscaled_from_scaled_amount(
+        total_asset_out_received)
+
+    return total_asset_out_received
+
+
+# The functions that carry out an order's swap on each DEX, keyed by the DEX names used for the quotes.
+swap_handlers = {
+    "algofi": swap_via_algofi,
+    "pactfi": swap_via_pact,
+    "tinyman": swap_via_tinyman
+}
+
 
 def run_bot():
     user_id = env("arbitrage:orderbook:user_id")
@@ -35,45 +148,55 @@ def run_bot():
         print("Unable to retrieve information on supported assets. Abandoning bot run.")
         sys.exit(1)
 
+    # The order book is queried on these fields every time round the loop below, so make sure there's an
+    # index for the query (this is a no-op if the index already exists).
+    db.orderbook.create_index(
+        [("user_id", ASCENDING), ("is_active", ASCENDING), ("is_completed", ASCENDING)])
+
     # Declare a list that will be used to keep track of the trades that are completed
     # in this run.
     swaps_completed = []
+    delay = float(env("arbitrage:orderbook:delay"))
 
     while (True):
-        # Query for the swaps that need to be carried out.
+        # Query for the swaps that need to be carried out. Only the fields we use are fetched, and they're
+        # all read up front so the cursor isn't held open while the swaps are being carried out.
         try:
-            cursor = db.orderbook.find({
+            docs = list(db.orderbook.find({
                 'user_id': user_id,
                 'is_active': True,
                 'is_completed': False
-            })
+            }, projection=ORDER_FIELDS))
         except RuntimeError as e:
             print(f"Error attempting to query order book: {e}")
             sys.exit(1)
 
         # Loop through the swaps to be carried out.
-        for doc in cursor:
+        for doc in docs:
             order_type = doc["order_type"]
-            amt_to_buy_sell = doc["amt_to_buy_sell"]
+            amt_to_buy_sell = Decimal(doc["amt_to_buy_sell"])
             asset_in_id = doc["asset_to_buy_with_sell_to"] if doc["order_type"] == "buy" else doc["asset_to_buy_sell"]
             asset_out_id = doc["asset_to_buy_sell"] if doc["order_type"] == "buy" else doc["asset_to_buy_with_sell_to"]
 
-            from_asset_decimals = supported_assets[asset_in_id].decimals
-            from_asset_token_code = supported_assets[asset_in_id].asset_code
-
-            to_asset_decimals = supported_assets[asset_out_id].decimals
-            to_asset_token_code = supported_assets[asset_out_id].asset_code
+            from_asset = supported_assets[asset_in_id]
+            to_asset = supported_assets[asset_out_id]
+            to_asset_decimals = to_asset.decimals
+            to_asset_token_code = to_asset.asset_code
 
             try:
                 # Get the LPs
                 lps = get_liquidity_pools(
-                    amm_clients, supported_assets[asset_in_id].asset_onchain_id, supported_assets[asset_out_id].asset_onchain_id)
+                    amm_clients, from_asset.asset_onchain_id, to_asset.asset_onchain_id)
 
                 # Get a quote for a swap of asset_in amt to asset_out with the configured slippage tolerance.
-                quotes = get_swap_quotes(amm_clients, lps, supported_assets[asset_in_id], supported_assets[asset_out_id], Decimal(
-                    amt_to_buy_sell), float(doc["slippage"]))
-                tinyman_amount_out_with_slippage = supported_assets[asset_out_id].get_unscaled_from_scaled_amount(
-                    quotes["tinyman"].amount_out_with_slippage.amount)
+                quotes = get_swap_quotes(amm_clients, lps, from_asset, to_asset, amt_to_buy_sell,
+                                         float(doc["slippage"]))
+                # The least each DEX that gave a quote would give us, in DEX_NAMES order so ties are settled the
+                # same way as everywhere else.
+                amounts_out = {
+                    dex: to_asset.get_unscaled_from_scaled_amount(get_quote_amounts_out_scaled(dex, quotes[dex])[1])
+                    for dex in DEX_NAMES if dex in quotes
+                }
 
                 #
                 # If doc["min_amt_to_receive_per_unit"] is set then we want to buy/sell only if we can get
@@ -82,25 +205,24 @@ def run_bot():
                 # If doc["max_amt_to_receive_per_unit"] is set then we want to buy/sell only if we will get
                 # no more than doc["max_amt_to_receive_per_unit"] of asset_out from the swap
                 #
-                requirement_met = False
                 if "min_amt_to_receive_per_unit" in doc:
                     more_or_less_wording = "at least"
                     buy_sell_amt = Decimal(
-                        doc["min_amt_to_receive_per_unit"]) * Decimal(amt_to_buy_sell)
-                    print(
-                        f"Swap must produce {more_or_less_wording} {buy_sell_amt:.{to_asset_decimals}f} {to_asset_token_code} to meet {order_type} requirements.")
+                        doc["min_amt_to_receive_per_unit"]) * amt_to_buy_sell
+                    if VERBOSE:
+                        print(
+                            f"Swap must produce {more_or_less_wording} {buy_sell_amt:.{to_asset_decimals}f} {to_asset_token_code} to meet {order_type} requirements.")
 
-                    if tinyman_amount_out_with_slippage >= buy_sell_amt or quotes["algofi"]["amount_out_with_slippage"] >= buy_sell_amt or quotes["pactfi"]["amount_out_with_slippage"] >= buy_sell_amt:
-                        requirement_met = True
+                    requirement_met = any(amount_out >= buy_sell_amt for amount_out in amounts_out.values())
                 elif "max_amt_to_receive_per_unit" in doc:
                     more_or_less_wording = "no more than"
                     buy_sell_amt = Decimal(
-                        doc["max_amt_to_receive_per_unit"]) * Decimal(amt_to_buy_sell)
-                    print(
-                        f"Swap must produce {more_or_less_wording} {buy_sell_amt:.{to_asset_decimals}f} {to_asset_token_code} to meet {order_type} requirements.")
+                        doc["max_amt_to_receive_per_unit"]) * amt_to_buy_sell
+                    if VERBOSE:
+                        print(
+                            f"Swap must produce {more_or_less_wording} {buy_sell_amt:.{to_asset_decimals}f} {to_asset_token_code} to meet {order_type} requirements.")
 
-                    if tinyman_amount_out_with_slippage <= buy_sell_amt or quotes["algofi"]["amount_out_with_slippage"] <= buy_sell_amt or quotes["pactfi"]["amount_out_with_slippage"] <= buy_sell_amt:
-                        requirement_met = True
+                    requirement_met = any(amount_out <= buy_sell_amt for amount_out in amounts_out.values())
                 else:
                     print("Order not configured properly. Skipping this order.")
                     continue
@@ -110,113 +232,11 @@ def run_bot():
                     print(
                         f"Swap condition met. Deciding whether to do the swap via Algofi, Tinyman or Pact...")
 
-                    if quotes["algofi"]["amount_out_with_slippage"] >= tinyman_amount_out_with_slippage and quotes["algofi"]["amount_out_with_slippage"] >= quotes["pactfi"]["amount_out_with_slippage"]:
-                        print("Executing swap via the Algofi DEX...")
-
-                        total_asset_out_received = quotes["algofi"]["amount_out_with_slippage"]
-                        print(
-                            f"Swapping {amt_to_buy_sell:.{from_asset_decimals}f} {from_asset_token_code} for {more_or_less_wording} {total_asset_out_received:.{to_asset_decimals}f} {to_asset_token_code}")
-
-                        from_asset_id = 1 if supported_assets[
-                            asset_in_id].asset_onchain_id == 0 else supported_assets[asset_in_id].asset_onchain_id
-                        swap_input_asset = Asset(
-                            amm_clients["algofi"], from_asset_id)
-                        swap_asset_scaled_amount = swap_input_asset.get_scaled_amount(
-                            amt_to_buy_sell)
-
-                        to_asset_id = 1 if supported_assets[
-                            asset_out_id].asset_onchain_id == 0 else supported_assets[asset_out_id].asset_onchain_id
-                        asset_out = Asset(amm_clients["algofi"], to_asset_id)
-                        min_scaled_amount_to_receive = asset_out.get_scaled_amount(
-                            quotes["algofi"]["amount_out_with_slippage"])
-
-                        if is_algofi_nanoswap_stable_asset_pair(from_asset_id, to_asset_id):
-                            swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
-                                account.getAddress(), swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=min_scaled_amount_to_receive, fee=5000)
-                        else:
-                            swap_exact_for_txn = lps["algofi"].get_swap_exact_for_txns(
-                                account.getAddress(), swap_input_asset, swap_asset_scaled_amount, min_amount_to_receive=min_scaled_amount_to_receive)
-
-                        swap_exact_for_txn.sign_with_private_key(
-                            account.getAddress(), account.getPrivateKey())
-                        result = swap_exact_for_txn.submit(
-                            amm_clients["algofi"].algod, wait=True)
-
-                        amt = get_algofi_swap_amount_out_scaled(
-                            result, amm_clients["algofi"], account)
-                        if amt is not None:
-                            total_asset_out_received = supported_assets[asset_out_id].get_unscaled_from_scaled_amount(
-                                amt)
-                    elif quotes["pactfi"]["amount_out_with_slippage"] >= tinyman_amount_out_with_slippage and quotes["pactfi"]["amount_out_with_slippage"] >= quotes["algofi"]["amount_out_with_slippage"]:
-                        print("Executing swap via the Pact DEX...")
-
-                        total_asset_out_received = quotes["pactfi"]["amount_out_with_slippage"]
-                        print(
-                            f"Swapping {amt_to_buy_sell:.{from_asset_decimals}f} {from_asset_token_code} for {more_or_less_wording} {total_asset_out_received:.{to_asset_decimals}f} {to_asset_token_code}")
-
-                        # Yo, let's do the swap!
-                        swap_tx_group = quotes["pactfi"]["prepared_swap"].prepare_tx_group(
-                            account.getAddress())
-                        signed_group = swap_tx_group.sign(
-                            account.getPrivateKey())
-                        tx_id = amm_clients["pactfi"].algod.send_transactions(
-                            signed_group)
-
-                        # wait for confirmation
-                        try:
-                            transaction.wait_for_confirmation(
-                                amm_clients["pactfi"].algod, tx_id)
-                        except Exception as err:
-                            print(err)
-                            sys.exit(1)
-
-                        # Note: We get our indexer.IndexerClient instance from our Algofi client instance because the Pact client
-                        # does not store an indexer client instance that we can use.
-                        amt = get_pact_swap_amount_out_scaled(
-                            tx_id, amm_clients["algofi"].indexer, account)
-                        if amt is not None:
-                            total_asset_out_received = supported_assets[asset_out_id].get_unscaled_from_scaled_amount(
-                                amt)
-                    else:
-                        print("Executing swap via the Tinyman DEX...")
-
-                        total_asset_out_received = quotes["tinyman"].amount_out_with_slippage.amount
-                        print(
-                            f"Swapping {amt_to_buy_sell:.{from_asset_decimals}f} {from_asset_token_code} to {quotes['tinyman'].amount_out_with_slippage}")
-
-                        # Prepare a transaction group.
-                        transaction_group = lps["tinyman"].prepare_swap_transactions_from_quote(
-                            quotes["tinyman"])
-
-                        # Sign the group with the wallet's key.
-                        transaction_group.sign_with_private_key(
-                            account.getAddress(), account.getPrivateKey())
-
-                        # Submit transactions to the network and wait for confirmation.
-                        amm_clients["tinyman"].submit(
-                            transaction_group, wait=True)
-
-                        # Check if any excess remains after the swap.
-                        to_asset_id = 0 if supported_assets[
-                            asset_out_id].asset_onchain_id == 1 else supported_assets[asset_out_id].asset_onchain_id
-                        tinyman_asset = amm_clients["tinyman"].fetch_asset(
-                            to_asset_id)
-                        excess = lps["tinyman"].fetch_excess_amounts()
-
-                        if tinyman_asset in excess:
-                            amount = excess[tinyman_asset]
-                            total_asset_out_received += amount.amount
-                            print(f'Excess: {amount}')
-
-                            transaction_group = lps["tinyman"].prepare_redeem_transactions(
-                                amount)
-                            transaction_group.sign_with_private_key(
-                                account.getAddress(), account.getPrivateKey())
-                            amm_clients["tinyman"].submit(
-                                transaction_group, wait=True)
-
-                        total_asset_out_received = supported_assets[asset_out_id].get_unscaled_from_scaled_amount(
-                            total_asset_out_received)
+                    # Go with whichever DEX gives us the most. On a tie Algofi is preferred over Pact, and Pact
+                    # over Tinyman.
+                    best_dex = max(amounts_out, key=amounts_out.get)
+                    total_asset_out_received = swap_handlers[best_dex](
+                        amm_clients, lps, account, quotes[best_dex], from_asset, to_asset, amt_to_buy_sell, more_or_less_wording)
 
                     print(
                         f"\nSwap completed! You received {total_asset_out_received:.{to_asset_decimals}f} {to_asset_token_code}.\n")
@@ -224,28 +244,35 @@ def run_bot():
                     # Swap will be marked as completed in the off-chain DB.
                     swaps_completed.append(
                         (doc["_id"], total_asset_out_received))
-                else:
+                elif VERBOSE:
                     print("Swap requirement not yet met.\n")
 
-                print(
-                    "--------------------------------------------------------------------------------\n")
+                if VERBOSE:
+                    print(
+                        "--------------------------------------------------------------------------------\n")
 
             except Exception as e:
                 print(f"Error: {e}")
 
-        # Update completed flag for the completed swaps.
-        for swap in swaps_completed:
-            db.orderbook.update_one(
-                {"_id": swap[0]},
-                {'$set':
-                    {
-                        'is_completed': True,
-                        'amt_received': float(swap[1]),
-                        'completed_date': datetime.today().replace(microsecond=0)
-                    }
-                 }
-            )
+        # Update completed flag for the completed swaps, all in one go. They're all stamped with the same
+        # completion time, in UTC as that's how MongoDB stores dates anyway.
+        if swaps_completed:
+            completed_date = datetime.now(timezone.utc).replace(microsecond=0)
+            db.orderbook.bulk_write([
+                UpdateOne(
+                    {"_id": swap[0]},
+                    {'$set':
+                        {
+                            'is_completed': True,
+                            'amt_received': float(swap[1]),
+                            'completed_date': completed_date
+                        }
+                     }
+                ) for swap in swaps_completed
+            ], ordered=False)
 
         swaps_completed.clear()
 
-        time.sleep(float(env("arbitrage:orderbook:delay")))
+        # Orders come from the off-chain DB rather than the chain, so the configured delay is the only wait
+        # between checks.
+        time.sleep(delay)
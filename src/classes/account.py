@@ -5,6 +5,7 @@ class Account:
     """Simple class that takes an Algorand wallet mnemonic and stores the corresponding
        address and private key for easy access.
     """
+    __slots__ = ("address", "private_key")
     address: str
     private_key: str
 
@@ -12,9 +13,3 @@ class Account:
         self.private_key = algosdk.mnemonic.to_private_key(mnemonic_phrase)
         self.address = algosdk.account.address_from_private_key(
             self.private_key)
-
-    def getAddress(self) -> str:
-        return self.address
-
-    def getPrivateKey(self) -> str:
-        return self.private_key
@@ -1,9 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from decimal import Decimal
 from typing import Any
 
 
-@dataclass
+@dataclass(slots=True)
 class AlgoAsset:
     """Simple class to store details of an Algorand asset."""
     id: str
@@ -13,6 +13,11 @@ class AlgoAsset:
     decimals: int
     is_native: bool
     is_active: bool
+    # 10**decimals, worked out once since every scaled/unscaled conversion needs it.
+    scale: Decimal = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.scale = Decimal(10) ** self.decimals
 
     def get_scaled_amount(self, amount: Decimal) -> int:
         """Returns an integer representation of asset amount scaled by asset's decimals.
@@ -23,7 +28,7 @@ class AlgoAsset:
         Returns:
         int
         """
-        return int(amount * Decimal(10**self.decimals))
+        return int(amount * self.scale)
 
     def get_unscaled_from_scaled_amount(self, amount_scaled: int) -> Decimal:
         """Takes an asset amount that has been scaled by asset's decimals and returns the amount before it was scaled.
@@ -34,12 +39,16 @@ class AlgoAsset:
         Returns:
         decimal.Decimal
         """
-        return Decimal(amount_scaled / (10**self.decimals))
+        return Decimal(amount_scaled) / self.scale
 
 
-@dataclass
+@dataclass(slots=True)
 class SwapAmount:
-    """Simple class to store details for an asset out amount from a DEX swap."""
+    """Simple class to store details for an asset out amount from a DEX swap.
+
+    The `_scaled` amounts are the same out amounts in the asset's base units (i.e. scaled by its
+    decimals), which is what the DEXs work with and what we compare on.
+    """
     to_asset: AlgoAsset
     from_asset: AlgoAsset
     quote: Any
@@ -48,3 +57,5 @@ class SwapAmount:
     amount_out_with_slippage: Decimal
     dex: str
     slippage: float
+    amount_out_scaled: int
+    amount_out_with_slippage_scaled: int
@@ -0,0 +1,114 @@
+import json
+from typing import Any, Dict
+from urllib import parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from algosdk import constants
+from algosdk.error import AlgodHTTPError, AlgodResponseError, IndexerHTTPError
+from algosdk.v2client import algod, indexer
+
+# How long (in seconds) to wait for algod or the indexer to respond before giving up, unless a call says otherwise.
+# Without it, a node that stops responding would hang a bot forever.
+REQUEST_TIMEOUT = 10
+
+
+def get_http_session() -> requests.Session:
+    """Returns a requests Session with a connection pool, so the algod and indexer clients can keep
+       their connections to the node open between calls instead of opening (and TLS handshaking)
+       a new one for every request.
+
+    Returns:
+    requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=Retry(total=2, backoff_factor=0.1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    return session
+
+
+def get_error_message(response: requests.Response) -> str:
+    """Returns the error message from a failed algod/indexer response."""
+    try:
+        return response.json()["message"]
+    except (ValueError, KeyError, TypeError):
+        return response.text
+
+
+def sort_dict_keys(dictionary: Dict[str, Any]) -> Dict[str, Any]:
+    """Returns a copy of a dictionary with its keys (and those of any dictionaries nested in it) sorted, the same
+       way the algosdk IndexerClient sorts its responses.
+    """
+    return {key: sort_dict_keys(value) if isinstance(value, dict) else value for key, value in sorted(dictionary.items())}
+
+
+class SessionAlgodClient(algod.AlgodClient):
+    """AlgodClient that sends its requests through a shared requests Session rather than opening a new
+       connection with urllib for every call.
+    """
+    session: requests.Session
+
+    def __init__(self, algod_token: str, algod_address: str, headers: Dict[str, str] = None, session: requests.Session = None) -> None:
+        super().__init__(algod_token, algod_address, headers=headers)
+        self.session = session if session is not None else get_http_session()
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json", **kwargs):
+        header = {"User-Agent": "py-algorand-sdk"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth:
+            header.update({constants.algod_auth_header: self.algod_token})
+        if requrl not in constants.unversioned_paths:
+            requrl = algod.api_version_path_prefix + requrl
+        if params:
+            requrl = requrl + "?" + parse.urlencode(params)
+
+        response = self.session.request(method, self.algod_address + requrl, headers=header, data=data,
+                                        timeout=kwargs.get("timeout") or REQUEST_TIMEOUT)
+        if not response.ok:
+            raise AlgodHTTPError(get_error_message(response), response.status_code)
+
+        if response_format == "json":
+            try:
+                return response.json()
+            except ValueError:
+                raise AlgodResponseError("Failed to parse JSON response from algod")
+
+        return response.content
+
+
+class SessionIndexerClient(indexer.IndexerClient):
+    """IndexerClient that sends its requests through a shared requests Session rather than opening a new
+       connection with urllib for every call.
+    """
+    session: requests.Session
+
+    def __init__(self, indexer_token: str, indexer_address: str, headers: Dict[str, str] = None, session: requests.Session = None) -> None:
+        super().__init__(indexer_token, indexer_address, headers=headers)
+        self.session = session if session is not None else get_http_session()
+
+    def indexer_request(self, method, requrl, params=None, data=None, headers=None, **kwargs):
+        header = {"User-Agent": "py-algorand-sdk"}
+        if self.headers:
+            header.update(self.headers)
+        if headers:
+            header.update(headers)
+        if requrl not in constants.no_auth and self.indexer_token:
+            header.update({constants.indexer_auth_header: self.indexer_token})
+        if requrl not in constants.unversioned_paths:
+            requrl = indexer.api_version_path_prefix + requrl
+        if params:
+            params = {key: json.dumps(value) if isinstance(value, bool) else value for key, value in params.items()}
+            requrl = requrl + "?" + parse.urlencode(params)
+
+        response = self.session.request(method, self.indexer_address + requrl, headers=header, data=data,
+                                        timeout=kwargs.get("timeout") or REQUEST_TIMEOUT)
+        if not response.ok:
+            raise IndexerHTTPError(get_error_message(response), response.status_code)
+
+        return sort_dict_keys(response.json())
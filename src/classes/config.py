@@ -0,0 +1,44 @@
+import json
+from functools import reduce
+from typing import Any, Dict
+
+# Default for Config.__call__ that tells "no default given" apart from a default of None.
+_MISSING = object()
+
+
+class Config:
+    """Simple class that loads a JSON config file once and gives easy access to its values by colon-separated
+       key (e.g. "arbitrage:threeway:amounts:slippage"). Each value is remembered after it is first looked up.
+    """
+    path: str
+    config: Dict[str, Any]
+    values: Dict[str, Any]
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path) as config_file:
+            self.config = json.load(config_file)
+        self.values = {}
+
+    def __call__(self, key: str, default: Any = _MISSING) -> Any:
+        """Returns the config value for the given key, or `default` if there is no such value.
+
+        Parameters:
+        key (str): Colon-separated path to the value in the config file
+        default (Any): Value to return if the key is not in the config file
+
+        Returns:
+        Any
+
+        Raises:
+        KeyError: If the key is not in the config file and no default was given
+        """
+        if key not in self.values:
+            try:
+                self.values[key] = reduce(lambda values, name: values[name], key.split(":"), self.config)
+            except (KeyError, TypeError):
+                if default is _MISSING:
+                    raise KeyError(f"{key} is not found in {self.path}")
+                return default
+
+        return self.values[key]
@@ -66,3 +66,20 @@ class PactLPNotFoundError(LPNotFoundError):
     def __init__(self, asset1_id, asset2_id):
         message = f"Pool for the asset pair with IDs {asset1_id} and {asset2_id} has not been created and/or initialized on the Pact DEX as yet!"
         super().__init__(asset1_id, asset2_id, message)
+
+
+class SwapFailedError(AlgoTradeBotError):
+    """Exception raised when a swap could not be carried out, even after retrying it with new quotes.
+
+    Attributes:
+        from_asset_code -- Code of the asset being swapped from
+        to_asset_code -- Code of the asset being swapped to
+        attempts -- How many times the swap was attempted
+    """
+
+    def __init__(self, from_asset_code, to_asset_code, attempts):
+        self.from_asset_code = from_asset_code
+        self.to_asset_code = to_asset_code
+        self.attempts = attempts
+        message = f"Swap from {from_asset_code} to {to_asset_code} failed after {attempts} attempts!"
+        super().__init__(message)
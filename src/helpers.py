@@ -1,19 +1,26 @@
+import atexit
 import os
 import sys
-import json
+import time
 import pactsdk
+from concurrent.futures import ThreadPoolExecutor
+from itertools import permutations
 from decimal import Decimal
-from typing import Any, Dict, Tuple
-from json_environ import Environ
-from pymongo import MongoClient
+from typing import Any, Dict, Iterable, List, Tuple
+from pymongo import ASCENDING, MongoClient
+from algofi_amm.v0.asset import Asset
 from algofi_amm.v0.client import AlgofiAMMMainnetClient, AlgofiAMMTestnetClient
 from algofi_amm.v0.config import PoolType, PoolStatus
 from tinyman.v1.client import TinymanMainnetClient, TinymanTestnetClient
+from algosdk.error import AlgodHTTPError, IndexerHTTPError
 from algosdk.v2client import algod, indexer
+from requests.exceptions import HTTPError
 
 from src.classes.account import Account
+from src.classes.config import Config
 from src.classes.asset import AlgoAsset, SwapAmount
-from src.classes.exceptions import AlgoTradeBotError, AlgofiLPNotFoundError, PactLPNotFoundError, \
+from src.classes.clients import SessionAlgodClient, SessionIndexerClient, get_http_session
+from src.classes.exceptions import AlgoTradeBotError, AlgofiLPNotFoundError, LPNotFoundError, PactLPNotFoundError, \
     SupportedAssetsLookupError, TinymanLPNotFoundError
 
 # Which Algorand network are we running against (mainnet or testnet).
@@ -28,13 +35,84 @@ except KeyError:
 
 file_path = os.path.abspath(os.path.dirname(__file__))
 env_path = os.path.join(file_path, f"../env/env-{network}.json")
-env = Environ(path=env_path)
+env = Config(path=env_path)
+
+# Whether to print the details of every quote the bots get. Those are printed on every round trip check,
+# and formatting them isn't free, so they're only printed when "verbose" is set to true in the config.
+VERBOSE = bool(env("verbose", default=False))
+
+# Currently there are NanoSwap pools on Algofi for the following stablecoin pairs:
+# STBL/USDC, STBL/USDT, USDC/USDT
+# The pairs are static for each network, so we work them out (in both directions) once up front.
+if network == "testnet":
+    algofi_nanoswap_pairs = frozenset(permutations((10458941, 26837931), 2))
+else:
+    algofi_nanoswap_pairs = frozenset(permutations((31566704, 312769, 465865291), 2))
 
 
 # We're using a global variable for the DB client connection so we only create the client
 # once, no matter how many times the get_db_client function below is called.
 client = None
 
+# The active assets from the off-chain DB (keyed by their on-chain IDs), along with when (time.monotonic()) they were
+# fetched. The assets hardly ever change, so get_supported_algo_assets only fetches them again once they're
+# SUPPORTED_ASSETS_TTL seconds old.
+supported_assets: Tuple[float, Dict[int, AlgoAsset]] | None = None
+SUPPORTED_ASSETS_TTL = 300
+
+# The fields of an asset document that get_algo_asset_from_db_doc uses, so the asset queries only fetch those
+# (_id is always returned).
+ASSET_FIELDS = ["asset_name", "asset_code", "asset_onchain_id", "decimals", "is_native", "is_active"]
+
+# AMM clients built by get_amm_clients, keyed by (account address, whether they use the backup node), so each set
+# is only built once. This also keeps the clients alive for as long as the assets cached against them below.
+amm_clients_cache: Dict[Tuple[str, bool], Dict[str, Any]] = {}
+
+# Algofi Asset instances, keyed by (id of the AMM client, asset ID). Building an Asset looks up the
+# asset's details on-chain, and those never change for the lifetime of the bot.
+algofi_assets: Dict[Tuple[int, int], Asset] = {}
+
+# Tinyman Asset instances, keyed the same way and cached for the same reason as the Algofi ones above.
+tinyman_assets: Dict[Tuple[int, int], Any] = {}
+
+# Pact Asset instances, keyed and cached the same way.
+pact_assets: Dict[Tuple[int, int], Any] = {}
+
+# Names the bots show (and check swaps against) for each supported DEX, in the order a DEX is preferred when its
+# quote ties with another's.
+DEX_NAMES = {"algofi": "Algofi", "pactfi": "Pact", "tinyman": "Tinyman"}
+
+# Errors the DEX SDKs raise when asked for an LP (or asset) that doesn't exist, e.g. a 404 from algod or an empty
+# list of pools from Pact. get_liquidity_pools treats these as the LP not being found. Anything else, like the node
+# being unreachable, isn't a missing LP so is left to propagate.
+LP_LOOKUP_ERRORS = (AlgodHTTPError, IndexerHTTPError, HTTPError, IndexError, KeyError, ValueError)
+
+# Algofi's get_pool also raises an AttributeError for an asset pair that has no pool.
+ALGOFI_LP_LOOKUP_ERRORS = LP_LOOKUP_ERRORS + (AttributeError,)
+
+# LPs found by get_liquidity_pools, as (time.monotonic() they were found, LP), keyed by (id of the AMM client, asset 1
+# ID, asset 2 ID). Finding an LP takes several lookups (Pact's go through its API), whereas an LP we already have only
+# needs its state refreshing, so they're reused for LIQUIDITY_POOLS_TTL seconds.
+liquidity_pools: Dict[Tuple[int, int, int], Tuple[float, Any]] = {}
+LIQUIDITY_POOLS_TTL = 60
+
+# When (time.monotonic()) each Pact LP's state was last fetched, keyed by id of the LP. get_pact_swap_quote only
+# refreshes an LP's state itself when it's older than PACT_POOL_STATE_MAX_AGE seconds, so an LP get_liquidity_pools
+# has only just fetched or refreshed isn't read from algod twice.
+pact_pools_updated: Dict[int, float] = {}
+PACT_POOL_STATE_MAX_AGE = 1.0
+
+# Thread pool used by get_liquidity_pools to look up an asset pair's LP on each DEX at once. It's kept separate
+# from the pool below, which calls get_liquidity_pools from its own threads, so the two can't deadlock.
+pool_executor = ThreadPoolExecutor(max_workers=9)
+
+# Thread pool used by get_liquidity_pools_batched to look up the LPs for several asset pairs at once.
+lp_executor = ThreadPoolExecutor(max_workers=6)
+
+# Thread pool used by get_swap_quotes to get the quotes from each DEX at once. It's kept separate from the
+# pool above (and from the bots' own pools) so quotes requested from inside those pools can't deadlock.
+quote_executor = ThreadPoolExecutor(max_workers=9)
+
 
 def get_network():
     return network
@@ -48,8 +126,19 @@ def get_db_client() -> (MongoClient | None):
         db_password = env("database:password")
 
         try:
+            # Order book and asset documents are compressed on the wire (zlib needs no extra packages), and a
+            # small pool is plenty as the bots only query the DB from one thread. Idle connections are dropped
+            # after a minute, and the timeouts make a DB that can't be reached fail fast rather than hang a bot.
             client = MongoClient(
-                f"mongodb+srv://{db_user}:{db_password}@{db_host}/?retryWrites=true&w=majority")
+                f"mongodb+srv://{db_user}:{db_password}@{db_host}/?retryWrites=true&w=majority",
+                compressors="zlib", minPoolSize=1, maxPoolSize=4, maxIdleTimeMS=60000,
+                serverSelectionTimeoutMS=5000, connectTimeoutMS=5000, socketTimeoutMS=10000,
+                appname="aggrefi-bots")
+            atexit.register(client.close)
+
+            # The asset lookups query on these fields, so make sure there's an index for them (this is a no-op
+            # if the index already exists).
+            client.aggrefidb.assets.create_index([("is_active", ASCENDING), ("asset_onchain_id", ASCENDING)])
         except BaseException as e:
             print(f"Error connecting to off-chain DB: {e}")
             client = None
@@ -57,79 +146,182 @@ def get_db_client() -> (MongoClient | None):
     return client
 
 
-def get_supported_algo_assets(index_with_onchain_id: bool = False):
-    """Returns a dictionary with details of the Algorand assets that can be traded with our bots."""
-    assets: Dict[int | str, AlgoAsset] = {}
-    client = get_db_client()
-    db = client.aggrefidb
-
-    cursor = db.assets.find({'is_active': True})
-    for doc in cursor:
-        assets[doc["asset_onchain_id"] if index_with_onchain_id else str(doc["_id"])] = AlgoAsset(
-            id=str(doc["_id"]),
-            asset_name=doc["asset_name"],
-            asset_code=doc["asset_code"],
-            asset_onchain_id=doc["asset_onchain_id"],
-            decimals=doc["decimals"],
-            is_native=doc["is_native"],
-            is_active=doc["is_active"]
-        )
+def get_algo_asset_from_db_doc(doc: Dict[str, Any]) -> AlgoAsset:
+    """Returns an AlgoAsset for an asset document from the off-chain DB."""
+    return AlgoAsset(
+        id=str(doc["_id"]),
+        asset_name=doc["asset_name"],
+        asset_code=doc["asset_code"],
+        asset_onchain_id=doc["asset_onchain_id"],
+        decimals=doc["decimals"],
+        is_native=doc["is_native"],
+        is_active=doc["is_active"]
+    )
+
+
+def get_supported_algo_assets(index_with_onchain_id: bool = False, refresh: bool = False):
+    """Returns a dictionary with details of the Algorand assets that can be traded with our bots.
+
+    Parameters:
+    index_with_onchain_id (bool): Should the assets be indexed by their on-chain IDs rather than their DB IDs? Defaults to False.
+    refresh (bool): Should the assets be fetched from the DB even if the ones fetched before aren't out of date yet? Defaults to False.
+
+    Returns:
+    Dict[int | str, AlgoAsset]
+    """
+    global supported_assets
+    if refresh or supported_assets is None or time.monotonic() - supported_assets[0] > SUPPORTED_ASSETS_TTL:
+        client = get_db_client()
+        db = client.aggrefidb
+
+        # All the assets are wanted, so ask for them in one batch rather than the default first batch of 101
+        # followed by more round-trips.
+        cursor = db.assets.find({'is_active': True}, projection=ASSET_FIELDS, batch_size=1000)
+        supported_assets = (time.monotonic(),
+                            {doc["asset_onchain_id"]: get_algo_asset_from_db_doc(doc) for doc in cursor})
+
+    if index_with_onchain_id:
+        return dict(supported_assets[1])
+
+    assets: Dict[int | str, AlgoAsset] = {asset.id: asset for asset in supported_assets[1].values()}
 
     return assets
 
 
 def get_asset_details(asset_ids: Tuple[int, ...]):
-    """Get details of a tuple of specified assets."""
-    supported_assets_dict = get_supported_algo_assets(
-        index_with_onchain_id=True)
+    """Get details of a tuple of specified assets.
+
+    Only the specified assets are fetched from the off-chain DB, unless all the supported assets have already
+    been fetched (and are still up to date), in which case they're looked up from those.
+
+    Parameters:
+    asset_ids (Tuple[int, ...]): On-chain IDs of the assets
+
+    Returns:
+    Dict[int, AlgoAsset]: The assets, indexed by their on-chain IDs. Any of the assets that aren't supported are left out.
+    """
+    if supported_assets is not None and time.monotonic() - supported_assets[0] <= SUPPORTED_ASSETS_TTL:
+        return {asset_id: supported_assets[1][asset_id] for asset_id in asset_ids if asset_id in supported_assets[1]}
 
-    if supported_assets_dict is None:
+    client = get_db_client()
+    if client is None:
         raise SupportedAssetsLookupError(
             'Unable to retrieve information on supported assets')
-    else:
-        assets: Dict[int, AlgoAsset] = {}
-        for asset_id in asset_ids:
-            assets[asset_id] = supported_assets_dict[asset_id]
 
-        return assets
+    cursor = client.aggrefidb.assets.find(
+        {'is_active': True, 'asset_onchain_id': {'$in': list(asset_ids)}}, projection=ASSET_FIELDS)
+    assets: Dict[int, AlgoAsset] = {doc["asset_onchain_id"]: get_algo_asset_from_db_doc(doc) for doc in cursor}
+
+    return assets
 
 
-def get_amm_clients(account: Account) -> Dict[str, AlgofiAMMTestnetClient | AlgofiAMMMainnetClient | TinymanTestnetClient | TinymanMainnetClient | pactsdk.PactClient]:
-    """Get and return instances of the supported AMM Clients."""
+def get_amm_clients(account: Account, use_backup_node: bool = False) -> Dict[str, AlgofiAMMTestnetClient | AlgofiAMMMainnetClient | TinymanTestnetClient | TinymanMainnetClient | pactsdk.PactClient]:
+    """Get and return instances of the supported AMM Clients.
+
+    Parameters:
+    account (Account): The account the clients trade with
+    use_backup_node (bool): Whether to connect to the backup algod/indexer node in the config instead of the main one
+
+    Returns:
+    Dict[str, AlgofiAMMTestnetClient | AlgofiAMMMainnetClient | TinymanTestnetClient | TinymanMainnetClient | pactsdk.PactClient]
+    """
+    cache_key = (account.address, use_backup_node)
+    if cache_key in amm_clients_cache:
+        return amm_clients_cache[cache_key]
+
     network = get_network()
     algod_token = env("algod:api_key")
-    algod_address = env("algod:algod")
-    indexer_address = env("algod:indexer")
+    if use_backup_node:
+        algod_address = env("algod:backup_algod")
+        indexer_address = env("algod:backup_indexer")
+    else:
+        algod_address = env("algod:algod")
+        indexer_address = env("algod:indexer")
     pact_api = env("pact_api")
     headers = {
         "X-API-Key": algod_token,
         "User-Agent": "algosdk"
     }
 
-    algod_client = algod.AlgodClient(
-        algod_token, algod_address, headers=headers)
-    indexer_client = indexer.IndexerClient(
-        "", indexer_address, headers=headers)
+    # Both clients share one pooled HTTP session, so connections to the node are reused across calls.
+    session = get_http_session()
+    algod_client = SessionAlgodClient(
+        algod_token, algod_address, headers=headers, session=session)
+    indexer_client = SessionIndexerClient(
+        "", indexer_address, headers=headers, session=session)
 
     if network == "testnet":
         algofi_client = AlgofiAMMTestnetClient(
-            user_address=account.getAddress(), algod_client=algod_client, indexer_client=indexer_client)
+            user_address=account.address, algod_client=algod_client, indexer_client=indexer_client)
         tinyman_client = TinymanTestnetClient(
-            user_address=account.getAddress(), algod_client=algod_client)
+            user_address=account.address, algod_client=algod_client)
     else:
         algofi_client = AlgofiAMMMainnetClient(
-            user_address=account.getAddress(), algod_client=algod_client, indexer_client=indexer_client)
+            user_address=account.address, algod_client=algod_client, indexer_client=indexer_client)
         tinyman_client = TinymanMainnetClient(
-            user_address=account.getAddress(), algod_client=algod_client)
+            user_address=account.address, algod_client=algod_client)
 
     pact_client = pactsdk.PactClient(algod_client, pact_api_url=pact_api)
 
-    return {
+    amm_clients_cache[cache_key] = {
         'algofi': algofi_client,
         'pactfi': pact_client,
         'tinyman': tinyman_client
     }
 
+    return amm_clients_cache[cache_key]
+
+
+def get_algofi_asset(amm_client: AlgofiAMMTestnetClient | AlgofiAMMMainnetClient, asset_id: int) -> Asset:
+    """Returns the Algofi Asset for the given asset ID, only creating it the first time it is asked for.
+
+    Parameters:
+    amm_client (AlgofiAMMTestnetClient | AlgofiAMMMainnetClient): Algofi AMM Client the asset belongs to
+    asset_id (int): Asset on-chain ID (ALGO is 1 on Algofi)
+
+    Returns:
+    Asset
+    """
+    key = (id(amm_client), asset_id)
+    if key not in algofi_assets:
+        algofi_assets[key] = Asset(amm_client, asset_id)
+
+    return algofi_assets[key]
+
+
+def get_tinyman_asset(amm_client: TinymanTestnetClient | TinymanMainnetClient, asset_id: int) -> Any:
+    """Returns the Tinyman Asset for the given asset ID, only fetching it the first time it is asked for.
+
+    Parameters:
+    amm_client (TinymanTestnetClient | TinymanMainnetClient): Tinyman Client the asset belongs to
+    asset_id (int): Asset on-chain ID (ALGO is 0 on Tinyman)
+
+    Returns:
+    tinyman.v1.assets.Asset
+    """
+    key = (id(amm_client), asset_id)
+    if key not in tinyman_assets:
+        tinyman_assets[key] = amm_client.fetch_asset(asset_id)
+
+    return tinyman_assets[key]
+
+
+def get_pact_asset(amm_client: pactsdk.PactClient, asset_id: int) -> Any:
+    """Returns the Pact Asset for the given asset ID, only fetching it the first time it is asked for.
+
+    Parameters:
+    amm_client (pactsdk.PactClient): Pact Client the asset belongs to
+    asset_id (int): Asset on-chain ID (ALGO is 0 on Pact)
+
+    Returns:
+    pactsdk.Asset
+    """
+    key = (id(amm_client), asset_id)
+    if key not in pact_assets:
+        pact_assets[key] = amm_client.fetch_asset(asset_id)
+
+    return pact_assets[key]
+
 
 def is_algofi_nanoswap_stable_asset_pair(asset1_id: int, asset2_id: int) -> bool:
     """Check and return true if a NanoSwap pool exists on Algofi for the given asset pair.
@@ -144,21 +336,143 @@ def is_algofi_nanoswap_stable_asset_pair(asset1_id: int, asset2_id: int) -> bool
     if asset1_id == asset2_id:
         raise AlgoTradeBotError("Assets in asset pair must be different!")
 
-    # Currently there are NanoSwap pools on Algofi for the following stablecoin pairs:
-    # STBL/USDC, STBL/USDT, USDC/USDT
-    network = get_network()
+    return (asset1_id, asset2_id) in algofi_nanoswap_pairs
 
-    if network == "testnet":
-        token_asset_ids = [10458941, 26837931]
-    else:
-        token_asset_ids = [31566704, 312769, 465865291]
 
-    return (asset1_id in token_asset_ids and asset2_id in token_asset_ids)
+def get_algofi_asset_id(asset_id: int) -> int:
+    """Returns the ID Algofi uses for an asset. ALGO has the ID 1 on Algofi, but 0 on Tinyman and Pact."""
+    return 1 if asset_id == 0 else asset_id
+
+
+def get_tinyman_asset_id(asset_id: int) -> int:
+    """Returns the ID Tinyman (and Pact) use for an asset. ALGO has the ID 0 on Tinyman and Pact, but 1 on Algofi."""
+    return 0 if asset_id == 1 else asset_id
+
+
+def get_cached_liquidity_pool(amm_client: Any, asset1_id: int, asset2_id: int) -> Any | None:
+    """Returns the LP get_liquidity_pools found for the asset pair on an AMM client's DEX, if it's not out of date."""
+    cached = liquidity_pools.get((id(amm_client), asset1_id, asset2_id))
+    if cached is None or time.monotonic() - cached[0] > LIQUIDITY_POOLS_TTL:
+        return None
+
+    return cached[1]
+
+
+def cache_liquidity_pool(amm_client: Any, asset1_id: int, asset2_id: int, pool: Any) -> None:
+    """Keeps an LP found for the asset pair on an AMM client's DEX, so get_liquidity_pools can reuse it."""
+    liquidity_pools[(id(amm_client), asset1_id, asset2_id)] = (time.monotonic(), pool)
+
+
+def get_algofi_liquidity_pool(amm_client: AlgofiAMMTestnetClient | AlgofiAMMMainnetClient, asset1_id: int, asset2_id: int,
+                              raise_error_on_missing_lp: bool) -> Any | None:
+    """Get the Algofi LP for an asset pair. See get_liquidity_pools for details of the parameters.
+
+    Returns:
+    Any | None: The LP, or None if there isn't one (and raise_error_on_missing_lp is False)
+    """
+    asset1_id = get_algofi_asset_id(asset1_id)
+    asset2_id = get_algofi_asset_id(asset2_id)
+
+    algofi_pool = get_cached_liquidity_pool(amm_client, asset1_id, asset2_id)
+    if algofi_pool is not None:
+        algofi_pool.refresh_state()
+        return algofi_pool
+
+    # Update: Algofi recently added NanoSwap pools for stable asset pairs. So let's
+    # include support for that.
+    pool_type = PoolType.NANOSWAP if is_algofi_nanoswap_stable_asset_pair(
+        asset1_id, asset2_id) else PoolType.CONSTANT_PRODUCT_25BP_FEE
+
+    try:
+        algofi_pool = amm_client.get_pool(
+            pool_type, asset1_id, asset2_id)
+    except ALGOFI_LP_LOOKUP_ERRORS:
+        algofi_pool = None
+
+    if algofi_pool is None or algofi_pool.pool_status == PoolStatus.UNINITIALIZED:
+        if raise_error_on_missing_lp:
+            raise AlgofiLPNotFoundError(asset1_id, asset2_id)
+        return None
+
+    cache_liquidity_pool(amm_client, asset1_id, asset2_id, algofi_pool)
+    return algofi_pool
+
+
+def get_tinyman_liquidity_pool(amm_client: TinymanTestnetClient | TinymanMainnetClient, asset1_id: int, asset2_id: int,
+                               raise_error_on_missing_lp: bool) -> Any | None:
+    """Get the Tinyman LP for an asset pair. See get_liquidity_pools for details of the parameters.
+
+    Returns:
+    Any | None: The LP, or None if there isn't one (and raise_error_on_missing_lp is False)
+    """
+    asset1_id = get_tinyman_asset_id(asset1_id)
+    asset2_id = get_tinyman_asset_id(asset2_id)
+
+    tinyman_pool = get_cached_liquidity_pool(amm_client, asset1_id, asset2_id)
+    if tinyman_pool is not None:
+        tinyman_pool.refresh()
+        return tinyman_pool
+
+    try:
+        asset1 = get_tinyman_asset(amm_client, asset1_id)
+        asset2 = get_tinyman_asset(amm_client, asset2_id)
+        tinyman_pool = amm_client.fetch_pool(asset1, asset2)
+    except LP_LOOKUP_ERRORS:
+        tinyman_pool = None
+
+    if tinyman_pool is None or not tinyman_pool.exists:
+        if raise_error_on_missing_lp:
+            raise TinymanLPNotFoundError(asset1_id, asset2_id)
+        return None
+
+    cache_liquidity_pool(amm_client, asset1_id, asset2_id, tinyman_pool)
+    return tinyman_pool
+
+
+def get_pact_liquidity_pool(amm_client: pactsdk.PactClient, asset1_id: int, asset2_id: int,
+                            raise_error_on_missing_lp: bool) -> Any | None:
+    """Get the Pact LP for an asset pair. See get_liquidity_pools for details of the parameters.
+
+    Returns:
+    Any | None: The LP, or None if there isn't one (and raise_error_on_missing_lp is False)
+    """
+    asset1_id = get_tinyman_asset_id(asset1_id)
+    asset2_id = get_tinyman_asset_id(asset2_id)
+
+    pact_pool = get_cached_liquidity_pool(amm_client, asset1_id, asset2_id)
+    if pact_pool is not None:
+        pact_pool.update_state()
+        pact_pools_updated[id(pact_pool)] = time.monotonic()
+        return pact_pool
+
+    try:
+        asset1 = get_pact_asset(amm_client, asset1_id)
+        asset2 = get_pact_asset(amm_client, asset2_id)
+        pact_pool = amm_client.fetch_pools_by_assets(
+            asset1, asset2)[0]
+    except LP_LOOKUP_ERRORS:
+        if raise_error_on_missing_lp:
+            raise PactLPNotFoundError(asset1_id, asset2_id)
+        return None
+
+    pact_pools_updated[id(pact_pool)] = time.monotonic()
+    cache_liquidity_pool(amm_client, asset1_id, asset2_id, pact_pool)
+    return pact_pool
+
+
+# Functions that get an asset pair's LP on each supported DEX, for get_liquidity_pools.
+liquidity_pool_getters = {
+    "algofi": get_algofi_liquidity_pool,
+    "tinyman": get_tinyman_liquidity_pool,
+    "pactfi": get_pact_liquidity_pool
+}
 
 
 def get_liquidity_pools(amm_clients: Dict[str, Any], asset1_id: int, asset2_id: int, raise_error_on_missing_lp: bool = True) -> Dict[str, Any]:
     """Get liquidity pool references for specified asset pairs on supported Algorand DEXs.
 
+    Each DEX's LP is a separate network round-trip, so they're all looked up at the same time.
+
     Parameters:
     amm_clients (Dict[str, Any]): Dictionary mapping of the AMM Clients to retrieve LPs for
     asset1_id (int): Asset 1 on-chain ID
@@ -169,81 +483,143 @@ def get_liquidity_pools(amm_clients: Dict[str, Any], asset1_id: int, asset2_id:
     Dict[str, Any]: A dictionary mapping of the LPs, where the indexes are the names of
                     the DEXs, i.e. algofi, tinyman, pactfi.
     """
-    pools: Dict[str, Any] = {}
-
     # Note: the ALGO asset has ID 0 on Tinyman's and Pact's DEXs but on Algofi it has the ID 1.
     # We will allow our bots to be configured with either of these two IDs for ALGO so
-    # we need to support that here.
+    # each DEX's getter maps the IDs to the ones that DEX uses.
+    futures = {dex: pool_executor.submit(get_pool, amm_clients[dex], asset1_id, asset2_id, raise_error_on_missing_lp)
+               for dex, get_pool in liquidity_pool_getters.items() if dex in amm_clients}
 
-    if "algofi" in amm_clients:
-        if asset1_id == 0:
-            asset1_id = 1
+    pools: Dict[str, Any] = {}
+    for dex, future in futures.items():
+        pool = future.result()
+        if pool is not None:
+            pools[dex] = pool
 
-        if asset2_id == 0:
-            asset2_id = 1
+    return pools
 
-        # Update: Algofi recently added NanoSwap pools for stable asset pairs. So let's
-        # include support for that.
-        pool_type = PoolType.NANOSWAP if is_algofi_nanoswap_stable_asset_pair(
-            asset1_id, asset2_id) else PoolType.CONSTANT_PRODUCT_25BP_FEE
 
-        try:
-            algofi_pool = amm_clients["algofi"].get_pool(
-                pool_type, asset1_id, asset2_id)
-
-            if algofi_pool.pool_status == PoolStatus.UNINITIALIZED:
-                if raise_error_on_missing_lp:
-                    raise AlgofiLPNotFoundError(asset1_id, asset2_id)
-            else:
-                pools["algofi"] = algofi_pool
-        except Exception as e:
-            if raise_error_on_missing_lp:
-                raise AlgofiLPNotFoundError(asset1_id, asset2_id)
+def get_liquidity_pools_batched(amm_clients: Dict[str, Any], asset_pairs: Iterable[Tuple[int, int]],
+                                raise_error_on_missing_lp: bool = True) -> Dict[Tuple[int, int], Dict[str, Any]]:
+    """Get liquidity pool references for several asset pairs in one go, looking up the pairs concurrently.
 
-    if "tinyman" in amm_clients:
-        if asset1_id == 1:
-            asset1_id = 0
+    Parameters:
+    amm_clients (Dict[str, Any]): Dictionary mapping of the AMM Clients to retrieve LPs for
+    asset_pairs (Iterable[Tuple[int, int]]): The (asset 1 on-chain ID, asset 2 on-chain ID) pairs to get LPs for
+    raise_error_on_missing_lp (bool): Should we raise an error when an LP for an asset pair is not found on any of the DEXs? Defaults to True.
 
-        if asset2_id == 1:
-            asset2_id = 0
+    Returns:
+    Dict[Tuple[int, int], Dict[str, Any]]: A dictionary mapping of each asset pair to its LPs, as returned
+                                           by get_liquidity_pools.
+    """
+    futures = {pair: lp_executor.submit(get_liquidity_pools, amm_clients, pair[0], pair[1], raise_error_on_missing_lp)
+               for pair in asset_pairs}
 
-        try:
-            asset1 = amm_clients["tinyman"].fetch_asset(asset1_id)
-            asset2 = amm_clients["tinyman"].fetch_asset(asset2_id)
-            tinyman_pool = amm_clients["tinyman"].fetch_pool(asset1, asset2)
-        except Exception as e:
-            if raise_error_on_missing_lp:
-                raise TinymanLPNotFoundError(asset1_id, asset2_id)
+    return {pair: future.result() for pair, future in futures.items()}
 
-        if not tinyman_pool.exists:
-            if raise_error_on_missing_lp:
-                raise TinymanLPNotFoundError(asset1_id, asset2_id)
-        else:
-            pools["tinyman"] = tinyman_pool
 
-    if "pactfi" in amm_clients:
-        if asset1_id == 1:
-            asset1_id = 0
+def get_algofi_swap_quote(pool: Any, from_asset: AlgoAsset, to_asset: AlgoAsset, asset_in_amt: Decimal, slippage: float) -> Dict[str, Any]:
+    """Get a quote from Algofi for performing a swap. See get_swap_quotes for details of the parameters."""
+    asset_in_amt_scaled = from_asset.get_scaled_amount(asset_in_amt)
+    from_asset_id = get_algofi_asset_id(from_asset.asset_onchain_id)
+    quote_algofi = pool.get_swap_exact_for_quote(
+        from_asset_id, asset_in_amt_scaled)
 
-        if asset2_id == 1:
-            asset2_id = 0
+    if from_asset_id == pool.asset1.asset_id:
+        amount_out_scaled = quote_algofi.asset2_delta
+    else:
+        amount_out_scaled = quote_algofi.asset1_delta
+
+    # The slippage is applied to the scaled amount in basis points, with integer arithmetic, rounding down to whole
+    # base units as that's the least the swap can be allowed to give.
+    amount_out_with_slippage_scaled = amount_out_scaled * (10000 - round(slippage * 10000)) // 10000
+    amount_out = to_asset.get_unscaled_from_scaled_amount(amount_out_scaled)
+    amount_out_with_slippage = to_asset.get_unscaled_from_scaled_amount(amount_out_with_slippage_scaled)
+    quote = {'amount_in': asset_in_amt, 'amount_out': amount_out,
+             'amount_out_with_slippage': amount_out_with_slippage, 'slippage': slippage,
+             'amount_out_scaled': amount_out_scaled,
+             'amount_out_with_slippage_scaled': amount_out_with_slippage_scaled}
+
+    if VERBOSE:
+        print(
+            f"Algofi quote: amount_in={from_asset.asset_code}('{asset_in_amt:.{from_asset.decimals}f}'), "
+            f"amount_out={to_asset.asset_code}('{amount_out:.{to_asset.decimals}f}'), slippage={slippage})")
+        print(
+            f"Minimum that will be received: {amount_out_with_slippage:.{to_asset.decimals}f} {to_asset.asset_code}\n")
 
-        try:
-            asset1 = amm_clients["pactfi"].fetch_asset(asset1_id)
-            asset2 = amm_clients["pactfi"].fetch_asset(asset2_id)
-            pact_pools = amm_clients["pactfi"].fetch_pools_by_assets(
-                asset1, asset2)
-            pools["pactfi"] = pact_pools[0]
-        except Exception as e:
-            if raise_error_on_missing_lp:
-                raise PactLPNotFoundError(asset1_id, asset2_id)
+    return quote
 
-    return pools
+
+def get_tinyman_swap_quote(amm_client: TinymanTestnetClient | TinymanMainnetClient, pool: Any, from_asset: AlgoAsset,
+                           to_asset: AlgoAsset, asset_in_amt: Decimal, slippage: float) -> Any:
+    """Get a quote from Tinyman for performing a swap. See get_swap_quotes for details of the parameters."""
+    asset_in_amt_scaled = from_asset.get_scaled_amount(asset_in_amt)
+    from_asset_id = get_tinyman_asset_id(from_asset.asset_onchain_id)
+    asset_ref = get_tinyman_asset(amm_client, from_asset_id)
+    quote = pool.fetch_fixed_input_swap_quote(
+        asset_ref(asset_in_amt_scaled), slippage)
+
+    if VERBOSE:
+        to_decimals = to_asset.decimals
+        print(f"Tinyman quote: {quote}")
+        print(
+            f"{to_asset.asset_code} per {from_asset.asset_code}: {quote.price:.{to_decimals}f}")
+        print(
+            f"{to_asset.asset_code} per {from_asset.asset_code} (worst case): {quote.price_with_slippage:.{to_decimals}f}")
+
+        amount_out_with_slippage = Decimal(
+            asset_in_amt * Decimal(quote.price_with_slippage))
+        print(
+            f"Minimum that will be received: {amount_out_with_slippage:.{to_decimals}f} {to_asset.asset_code}\n")
+
+    return quote
+
+
+def get_pact_swap_quote(amm_client: pactsdk.PactClient, pool: Any, from_asset: AlgoAsset, to_asset: AlgoAsset,
+                        asset_in_amt: Decimal, slippage: float) -> Dict[str, Any]:
+    """Get a quote from Pact for performing a swap. See get_swap_quotes for details of the parameters."""
+    # Pact's pool state needs refreshing periodically, unless get_liquidity_pools has only just done it.
+    updated = pact_pools_updated.get(id(pool))
+    if updated is None or time.monotonic() - updated > PACT_POOL_STATE_MAX_AGE:
+        pool.update_state()
+        pact_pools_updated[id(pool)] = time.monotonic()
+
+    asset_in_amt_scaled = from_asset.get_scaled_amount(asset_in_amt)
+    from_asset_id = get_tinyman_asset_id(from_asset.asset_onchain_id)
+    asset_ref = get_pact_asset(amm_client, from_asset_id)
+    slippage_pct = slippage * float(10**2)
+
+    swap = pool.prepare_swap(
+        asset=asset_ref,
+        amount=asset_in_amt_scaled,
+        slippage_pct=slippage_pct
+    )
+
+    swap_effect = swap.effect
+    amount_out = to_asset.get_unscaled_from_scaled_amount(
+        swap_effect.amount_received)
+    amount_out_with_slippage = to_asset.get_unscaled_from_scaled_amount(
+        swap_effect.minimum_amount_received)
+    quote = {'amount_in': asset_in_amt, 'amount_out': amount_out,
+             'amount_out_with_slippage': amount_out_with_slippage,
+             'slippage': slippage, 'prepared_swap': swap,
+             'amount_out_scaled': swap_effect.amount_received,
+             'amount_out_with_slippage_scaled': swap_effect.minimum_amount_received}
+
+    if VERBOSE:
+        print(
+            f"Pact quote: amount_in={from_asset.asset_code}('{asset_in_amt:.{from_asset.decimals}f}'), "
+            f"amount_out={to_asset.asset_code}('{amount_out:.{to_asset.decimals}f}'), slippage={slippage})")
+        print(
+            f"Minimum that will be received: {amount_out_with_slippage:.{to_asset.decimals}f} {to_asset.asset_code}\n")
+
+    return quote
 
 
 def get_swap_quotes(amm_clients: Dict[str, Any], pools: Dict[str, Any], from_asset: AlgoAsset, to_asset: AlgoAsset, asset_in_amt: Decimal, slippage: float):
     """Get quotes from all supported Algorand DEXs for performing a swap.
 
+    Each DEX's quote is a separate network round-trip, so they're all requested at the same time.
+
     Parameters:
     amm_clients (Dict[str, Any]): Dictionary mapping of AMM Clients for each supported DEX
     pools (Dict[str, Any]): Dictionary mapping of the LPs for each supported DEX
@@ -254,81 +630,54 @@ def get_swap_quotes(amm_clients: Dict[str, Any], pools: Dict[str, Any], from_ass
 
     Returns:
     Dict[str, Any]: A dictionary mapping of the swap quotes, where the indexes are the names of
-                    the DEXs, i.e. algofi, tinyman and pactfi.
+                    the DEXs, i.e. algofi, tinyman and pactfi. A DEX that fails to give a quote is left out,
+                    unless they all fail, in which case the first DEX's error is raised.
+
+    Raises:
+    LPNotFoundError: If there isn't an LP for the asset pair on any of the DEXs
     """
-    quotes: Dict[str, Any] = {}
-    asset_in_amt_scaled = from_asset.get_scaled_amount(asset_in_amt)
-    from_decimals = from_asset.decimals
-    to_decimals = to_asset.decimals
+    if not pools:
+        raise LPNotFoundError(from_asset.asset_onchain_id, to_asset.asset_onchain_id,
+                              f"No LP for the {from_asset.asset_code}/{to_asset.asset_code} asset pair was found on any of the DEXs!")
 
-    # Pact's pool state needs refreshing periodically.
-    pools["pactfi"].update_state()
+    futures = {}
 
     if "algofi" in pools:
-        from_asset_id = 1 if from_asset.asset_onchain_id == 0 else from_asset.asset_onchain_id
-        quote_algofi = pools["algofi"].get_swap_exact_for_quote(
-            from_asset_id, asset_in_amt_scaled)
+        futures["algofi"] = quote_executor.submit(
+            get_algofi_swap_quote, pools["algofi"], from_asset, to_asset, asset_in_amt, slippage)
 
-        if from_asset_id == pools["algofi"].asset1.asset_id:
-            amount_out = to_asset.get_unscaled_from_scaled_amount(
-                quote_algofi.asset2_delta)
-        else:
-            amount_out = to_asset.get_unscaled_from_scaled_amount(
-                quote_algofi.asset1_delta)
+    if "tinyman" in pools:
+        futures["tinyman"] = quote_executor.submit(
+            get_tinyman_swap_quote, amm_clients["tinyman"], pools["tinyman"], from_asset, to_asset, asset_in_amt, slippage)
 
-        amount_out_with_slippage = amount_out * Decimal(1.0 - slippage)
-        quotes["algofi"] = {'amount_in': asset_in_amt, 'amount_out': amount_out,
-                            'amount_out_with_slippage': amount_out_with_slippage, 'slippage': slippage}
+    if "pactfi" in pools:
+        futures["pactfi"] = quote_executor.submit(
+            get_pact_swap_quote, amm_clients["pactfi"], pools["pactfi"], from_asset, to_asset, asset_in_amt, slippage)
 
-        print(
-            f"Algofi quote: amount_in={from_asset.asset_code}('{asset_in_amt:.{from_decimals}f}'), "
-            f"amount_out={to_asset.asset_code}('{amount_out:.{to_decimals}f}'), slippage={slippage})")
-        print(
-            f"Minimum that will be received: {amount_out_with_slippage:.{to_decimals}f} {to_asset.asset_code}\n")
+    quotes = {}
+    errors = []
+    for dex, future in futures.items():
+        try:
+            quotes[dex] = future.result()
+        except Exception as e:
+            if VERBOSE:
+                print(f"Unable to get a quote from {DEX_NAMES[dex]}: {e}")
+            errors.append(e)
 
-    if "tinyman" in pools:
-        from_asset_id = 0 if from_asset.asset_onchain_id == 1 else from_asset.asset_onchain_id
-        asset_ref = amm_clients["tinyman"].fetch_asset(from_asset_id)
-        quotes["tinyman"] = pools["tinyman"].fetch_fixed_input_swap_quote(
-            asset_ref(asset_in_amt_scaled), slippage)
-        print(f"Tinyman quote: {quotes['tinyman']}")
-        print(
-            f"{to_asset.asset_code} per {from_asset.asset_code}: {quotes['tinyman'].price:.{to_decimals}f}")
-        print(
-            f"{to_asset.asset_code} per {from_asset.asset_code} (worst case): {quotes['tinyman'].price_with_slippage:.{to_decimals}f}")
+    if errors and not quotes:
+        raise errors[0]
 
-        amount_out_with_slippage = Decimal(
-            asset_in_amt * Decimal(quotes['tinyman'].price_with_slippage))
-        print(
-            f"Minimum that will be received: {amount_out_with_slippage:.{to_decimals}f} {to_asset.asset_code}\n")
+    return quotes
 
-    if "pactfi" in pools:
-        from_asset_id = 0 if from_asset.asset_onchain_id == 1 else from_asset.asset_onchain_id
-        asset_ref = amm_clients["pactfi"].fetch_asset(from_asset_id)
-        slippage_pct = slippage * float(10**2)
-
-        swap = pools["pactfi"].prepare_swap(
-            asset=asset_ref,
-            amount=asset_in_amt_scaled,
-            slippage_pct=slippage_pct
-        )
-
-        swap_effect = swap.effect
-        amount_out = to_asset.get_unscaled_from_scaled_amount(
-            swap_effect.amount_received)
-        amount_out_with_slippage = to_asset.get_unscaled_from_scaled_amount(
-            swap_effect.minimum_amount_received)
-        quotes["pactfi"] = {'amount_in': asset_in_amt, 'amount_out': amount_out,
-                            'amount_out_with_slippage': amount_out_with_slippage,
-                            'slippage': slippage, 'prepared_swap': swap}
 
-        print(
-            f"Pact quote: amount_in={from_asset.asset_code}('{asset_in_amt:.{from_decimals}f}'), "
-            f"amount_out={to_asset.asset_code}('{amount_out:.{to_decimals}f}'), slippage={slippage})")
-        print(
-            f"Minimum that will be received: {amount_out_with_slippage:.{to_decimals}f} {to_asset.asset_code}\n")
+def get_quote_amounts_out_scaled(dex: str, quote: Any) -> Tuple[int, int]:
+    """Returns the amount out and the amount out with slippage (both scaled by the asset out's decimals) of a DEX's
+       quote, as returned by get_swap_quotes.
+    """
+    if dex == "tinyman":
+        return quote.amount_out.amount, quote.amount_out_with_slippage.amount
 
-    return quotes
+    return quote["amount_out_scaled"], quote["amount_out_with_slippage_scaled"]
 
 
 def get_highest_swap_amount_out(amm_clients: Dict[str, Any], dex_pools: Dict[str, Any], from_asset: AlgoAsset,
@@ -336,156 +685,287 @@ def get_highest_swap_amount_out(amm_clients: Dict[str, Any], dex_pools: Dict[str
     quotes = get_swap_quotes(amm_clients, dex_pools,
                              from_asset, to_asset, asset_in_amt, slippage)
 
-    if "tinyman" in quotes:
-        tinyman_amount_out = to_asset.get_unscaled_from_scaled_amount(
-            quotes["tinyman"].amount_out.amount)
-        tinyman_amount_out_with_slippage = to_asset.get_unscaled_from_scaled_amount(
-            quotes["tinyman"].amount_out_with_slippage.amount)
-
-    # Check if all supported pools are available.
-    if "tinyman" in quotes and "algofi" in quotes and "pactfi" in quotes:
-        if quotes["algofi"]["amount_out"] >= tinyman_amount_out and quotes["algofi"]["amount_out"] >= quotes["pactfi"]["amount_out"]:
-            higher_amt = quotes["algofi"]["amount_out"]
-            higher_amt_with_slippage = quotes["algofi"]["amount_out_with_slippage"]
-            winning_dex = "Algofi"
-            quote = quotes["algofi"]
-        elif quotes["pactfi"]["amount_out"] >= tinyman_amount_out and quotes["pactfi"]["amount_out"] >= quotes["algofi"]["amount_out"]:
-            higher_amt = quotes["pactfi"]["amount_out"]
-            higher_amt_with_slippage = quotes["pactfi"]["amount_out_with_slippage"]
-            winning_dex = "Pact"
-            quote = quotes["pactfi"]
-        else:
-            higher_amt = tinyman_amount_out
-            higher_amt_with_slippage = tinyman_amount_out_with_slippage
-            winning_dex = "Tinyman"
-            quote = quotes["tinyman"]
-
-    # Check if Tinyman and Algofi pools available, but not Pact.
-    if "tinyman" in quotes and "algofi" in quotes and "pactfi" not in quotes:
-        if quotes["algofi"]["amount_out"] >= tinyman_amount_out:
-            higher_amt = quotes["algofi"]["amount_out"]
-            higher_amt_with_slippage = quotes["algofi"]["amount_out_with_slippage"]
-            winning_dex = "Algofi"
-            quote = quotes["algofi"]
-        else:
-            higher_amt = tinyman_amount_out
-            higher_amt_with_slippage = tinyman_amount_out_with_slippage
-            winning_dex = "Tinyman"
-            quote = quotes["tinyman"]
-
-    # Check if Tinyman and Pact pools available, but not Algofi.
-    if "tinyman" in quotes and "pactfi" in quotes and "algofi" not in quotes:
-        if quotes["pactfi"]["amount_out"] >= tinyman_amount_out:
-            higher_amt = quotes["pactfi"]["amount_out"]
-            higher_amt_with_slippage = quotes["pactfi"]["amount_out_with_slippage"]
-            winning_dex = "Pact"
-            quote = quotes["pactfi"]
-        else:
-            higher_amt = tinyman_amount_out
-            higher_amt_with_slippage = tinyman_amount_out_with_slippage
-            winning_dex = "Tinyman"
-            quote = quotes["tinyman"]
-
-    # Check if Algofi and Pact pools available, but not Tinyman.
-    if "algofi" in quotes and "pactfi" in quotes and "tinyman" not in quotes:
-        if quotes["algofi"]["amount_out"] >= quotes["pactfi"]["amount_out"]:
-            higher_amt = quotes["algofi"]["amount_out"]
-            higher_amt_with_slippage = quotes["algofi"]["amount_out_with_slippage"]
-            winning_dex = "Algofi"
-            quote = quotes["algofi"]
-        else:
-            higher_amt = quotes["pactfi"]["amount_out"]
-            higher_amt_with_slippage = quotes["pactfi"]["amount_out_with_slippage"]
-            winning_dex = "Pact"
-            quote = quotes["pactfi"]
-
-    # Check if only Tinyman pool available.
-    if "tinyman" in quotes and "algofi" not in quotes and "pactfi" not in quotes:
-        higher_amt = tinyman_amount_out
-        higher_amt_with_slippage = tinyman_amount_out_with_slippage
-        winning_dex = "Tinyman"
-        quote = quotes["tinyman"]
-
-    # Check if only Algofi pool available.
-    if "algofi" in quotes and "tinyman" not in quotes and "pactfi" not in quotes:
-        higher_amt = quotes["algofi"]["amount_out"]
-        higher_amt_with_slippage = quotes["algofi"]["amount_out_with_slippage"]
-        winning_dex = "Algofi"
-        quote = quotes["algofi"]
-
-    # Check if only Pact pool available.
-    if "pactfi" in quotes and "algofi" not in quotes and "tinyman" not in quotes:
-        higher_amt = quotes["pactfi"]["amount_out"]
-        higher_amt_with_slippage = quotes["pactfi"]["amount_out_with_slippage"]
-        winning_dex = "Pact"
-        quote = quotes["pactfi"]
-
-    return SwapAmount(to_asset=to_asset, from_asset=from_asset, quote=quote, amount_in=asset_in_amt, amount_out=higher_amt,
-                      amount_out_with_slippage=higher_amt_with_slippage, dex=winning_dex, slippage=slippage)
-
-
-def get_algofi_swap_amount_out_scaled(swap_result, amm_client, account: Account) -> int:
-    # TODO: Please be sure to test this function thoroughly!
-    amount = None
-    response = amm_client.indexer.search_transactions_by_address(
-        address=account.getAddress(), block=swap_result["confirmed-round"])
+    # All the quotes are for the same asset out, so we can compare them on the scaled (integer)
+    # amounts the DEXs gave us and only convert the winning amounts back to decimals at the end.
+    # On a tie, Algofi is preferred over Pact, and Pact over Tinyman.
+    amounts_out_scaled = {dex: get_quote_amounts_out_scaled(dex, quotes[dex]) for dex in DEX_NAMES if dex in quotes}
+    winning_dex = max(amounts_out_scaled, key=lambda dex: amounts_out_scaled[dex][0])
+    higher_amt_scaled, higher_amt_with_slippage_scaled = amounts_out_scaled[winning_dex]
 
-    try:
-        print(json.dumps(swap_result, indent=4))
-        print("")
-        print(json.dumps(response, indent=4))
-
-        for tx_details in response["transactions"]:
-            if tx_details["tx-type"] == "appl" and tx_details["group"] == swap_result["txn"]["txn"]["grp"]:
-                # Check through the inner txns for the one we want
-                for txn in tx_details["inner-txns"]:
-                    if txn["tx-type"] == "pay" and txn["sender"] == swap_result["txn"]["txn"]["arcv"]:
-                        amount = txn['payment-transaction']['amount']
-                        raise StopIteration
-                    elif txn["tx-type"] == "axfer" and txn["asset-transfer-transaction"]["receiver"] == account.getAddress():
-                        amount = txn['asset-transfer-transaction']['amount']
-                        raise StopIteration
-    except StopIteration:
-        pass
-
-    return amount
-
-
-def get_pact_swap_amount_out_scaled(tx_id: str, indexer_client: indexer.IndexerClient, account: Account) -> int:
-    # TODO: Please be sure to test this function thoroughly as well!
-    amount = None
-    tx_response = indexer_client.search_transactions_by_address(
-        address=account.getAddress(), txid=tx_id)
-    block_response = indexer_client.search_transactions_by_address(
-        address=account.getAddress(), block=tx_response["transactions"][0]["confirmed-round"])
+    return SwapAmount(to_asset=to_asset, from_asset=from_asset, quote=quotes[winning_dex], amount_in=asset_in_amt,
+                      amount_out=to_asset.get_unscaled_from_scaled_amount(higher_amt_scaled),
+                      amount_out_with_slippage=to_asset.get_unscaled_from_scaled_amount(higher_amt_with_slippage_scaled),
+                      dex=DEX_NAMES[winning_dex], slippage=slippage, amount_out_scaled=higher_amt_scaled,
+                      amount_out_with_slippage_scaled=higher_amt_with_slippage_scaled)
+
+
+def get_pool_reserves(dex: str, pool: Any, from_asset_id: int) -> Tuple[Decimal, Decimal, Decimal] | None:
+    """Get the reserves and fee of a constant product LP, as seen when swapping the given asset into it.
+
+    Parameters:
+    dex (str): Name of the DEX the LP is on, i.e. algofi, tinyman or pactfi
+    pool (Any): The LP, as returned by get_liquidity_pools
+    from_asset_id (int): On-chain ID of the asset being swapped into the LP
 
+    Returns:
+    Tuple[Decimal, Decimal, Decimal] | None: The reserve of the asset going in and the reserve of the asset coming
+                                             out (both scaled by their decimals), and the fraction of the amount in
+                                             that is left after the LP's fee (e.g. 0.997 for a 0.3% fee). None when
+                                             the LP isn't a constant product pool we know the reserves of.
+    """
     try:
-        print(json.dumps(block_response, indent=4))
+        if dex == "algofi":
+            # NanoSwap pools aren't constant product pools.
+            if pool.pool_type != PoolType.CONSTANT_PRODUCT_25BP_FEE:
+                return None
+
+            fee = Decimal("0.9975")
+            from_asset_id = get_algofi_asset_id(from_asset_id)
+            reserves = (pool.asset1_balance, pool.asset2_balance)
+            is_asset1 = from_asset_id == pool.asset1.asset_id
+        elif dex == "tinyman":
+            fee = Decimal("0.997")
+            from_asset_id = get_tinyman_asset_id(from_asset_id)
+            reserves = (pool.asset1_reserves, pool.asset2_reserves)
+            is_asset1 = from_asset_id == pool.asset1.id
+        elif dex == "pactfi":
+            # Stableswap pools aren't constant product pools.
+            if pool.pool_type != "CONSTANT_PRODUCT":
+                return None
+
+            fee = 1 - Decimal(pool.fee_bps) / 10000
+            from_asset_id = get_tinyman_asset_id(from_asset_id)
+            reserves = (pool.state.total_primary, pool.state.total_secondary)
+            is_asset1 = from_asset_id == pool.primary_asset.index
+        else:
+            return None
+    except AttributeError:
+        return None
+
+    reserve_in, reserve_out = reserves if is_asset1 else reserves[::-1]
+    if not reserve_in or not reserve_out:
+        return None
+
+    return Decimal(reserve_in), Decimal(reserve_out), fee
+
+
+def get_all_pool_reserves(pools: Dict[str, Any], from_asset_id: int) -> List[Tuple[Decimal, Decimal, Decimal]] | None:
+    """Get the reserves and fee (see get_pool_reserves) of every LP for an asset pair, as seen when swapping the
+       given asset into them.
+
+    Parameters:
+    pools (Dict[str, Any]): Dictionary mapping of the LPs for the asset pair, as returned by get_liquidity_pools
+    from_asset_id (int): On-chain ID of the asset being swapped in
+
+    Returns:
+    List[Tuple[Decimal, Decimal, Decimal]] | None: None when there are no LPs or any of them isn't a constant product
+                                                   pool we know the reserves of.
+    """
+    all_reserves = []
+    for dex, pool in pools.items():
+        reserves = get_pool_reserves(dex, pool, from_asset_id)
+        if reserves is None:
+            return None
+        all_reserves.append(reserves)
+
+    return all_reserves or None
+
+
+def get_max_swap_amount_out_scaled(pools: Dict[str, Any], from_asset_id: int, amount_in_scaled: int) -> Decimal | None:
+    """Get an upper bound on the amount out that swapping the given amount into any of the LPs for an asset pair
+       could give, without asking the DEXs for quotes.
+
+    Price impact only ever makes a constant product LP give less than its marginal price (after fees), so the amount
+    in at the best marginal price out of the LPs is more than any of them will quote.
 
-        for tx_details in block_response["transactions"]:
-            if tx_details["tx-type"] == "appl" and tx_details["group"] == tx_response["transactions"][0]["group"]:
-                # Check through the inner txns for the one we want
-                for txn in tx_details["inner-txns"]:
-                    if txn["tx-type"] == "pay" and txn["sender"] == tx_response["transactions"][0]["asset-transfer-transaction"]["receiver"]:
-                        amount = txn['payment-transaction']['amount']
-                        raise StopIteration
-                    elif txn["tx-type"] == "axfer" and txn["asset-transfer-transaction"]["receiver"] == account.getAddress():
-                        amount = txn['asset-transfer-transaction']['amount']
-                        raise StopIteration
-    except StopIteration:
-        pass
+    Parameters:
+    pools (Dict[str, Any]): Dictionary mapping of the LPs for the asset pair, as returned by get_liquidity_pools
+    from_asset_id (int): On-chain ID of the asset being swapped in
+    amount_in_scaled (int): Amount of the asset being swapped in, scaled by its decimals
+
+    Returns:
+    Decimal | None: The bound, scaled by the decimals of the asset out. None when any of the LPs isn't a constant
+                    product pool we know the reserves of (e.g. an Algofi NanoSwap or Pact stableswap pool), as it
+                    can give more than the constant product formula allows, so the second quote must be fetched.
+    """
+    max_amount_out = None
+    for dex, pool in pools.items():
+        reserves = get_pool_reserves(dex, pool, from_asset_id)
+        if reserves is None:
+            return None
+
+        reserve_in, reserve_out, fee = reserves
+        amount_out = fee * amount_in_scaled * reserve_out / reserve_in
+        if max_amount_out is None or amount_out > max_amount_out:
+            max_amount_out = amount_out
+
+    return max_amount_out
+
+
+def get_optimal_cycle_amounts(legs: List[Tuple[Decimal, Decimal, Decimal]]) -> Tuple[Decimal, Decimal]:
+    """Work out the amount to put into a cycle of swaps through constant product LPs that maximizes the profit
+       made, along with the amount that comes out of the cycle for it.
+
+    The LPs along the cycle are folded into one equivalent constant product LP, for which the profit maximizing
+    amount in has a closed form.
+
+    Parameters:
+    legs (List[Tuple[Decimal, Decimal, Decimal]]): Reserves and fee (see get_pool_reserves) of the LP used for each
+                                                   leg of the cycle, in order
+
+    Returns:
+    Tuple[Decimal, Decimal]: The optimal amount in and the resulting amount out, both scaled by the decimals of the
+                             asset the cycle starts and ends with. The amount in is 0 when no amount makes a profit.
+    """
+    reserve_in, reserve_out, first_fee = legs[0]
+    for leg_reserve_in, leg_reserve_out, fee in legs[1:]:
+        denominator = leg_reserve_in + fee * reserve_out
+        reserve_in = reserve_in * leg_reserve_in / denominator
+        reserve_out = fee * reserve_out * leg_reserve_out / denominator
+
+    if first_fee * reserve_out <= reserve_in:
+        return Decimal(0), Decimal(0)
+
+    amount_in = ((first_fee * reserve_in * reserve_out).sqrt() - reserve_in) / first_fee
+    amount_out = first_fee * amount_in * reserve_out / (reserve_in + first_fee * amount_in)
+
+    return amount_in, amount_out
+
+
+def get_swap_amount_out_scaled(signed_transactions: Iterable[Any], algod_client: algod.AlgodClient, account: Account) -> int:
+    """Get the amount of the asset out (scaled to its decimals) that a swap's LP actually sent to the account.
+
+    The LP sends the asset out in an inner transaction of the swap's app call. The app call has only just been
+    confirmed, so algod still has its details, inner transactions included, and we don't need to go through the
+    indexer (which can lag behind algod) for them.
+
+    Parameters:
+    signed_transactions (Iterable[algosdk.future.transaction.SignedTransaction]): The swap's signed and submitted transactions
+    algod_client (algod.AlgodClient): Algod client the swap was submitted with
+    account (Account): The account that carried out the swap
+
+    Returns:
+    int: The amount received, or None if it could not be found
+    """
+    address = account.address
+
+    for signed_txn in signed_transactions:
+        if signed_txn.transaction.type != "appl":
+            continue
+
+        tx_info = algod_client.pending_transaction_info(signed_txn.get_txid())
+        for inner_txn in tx_info.get("inner-txns", []):
+            txn = inner_txn["txn"]["txn"]
+            if txn["type"] == "pay" and txn.get("rcv") == address:
+                return txn.get("amt", 0)
+            elif txn["type"] == "axfer" and txn.get("arcv") == address:
+                return txn.get("aamt", 0)
+
+    return None
+
+
+def get_algofi_swap_amount_out_scaled(transaction_group, algod_client: algod.AlgodClient, account: Account) -> int:
+    """Get the amount of the asset out (scaled to its decimals) that an Algofi swap actually sent to the account.
+
+    The result of submit(..., wait=True) is for the group's first transaction, the transfer into the pool, which has
+    no inner transactions, so the amount is looked up from the group's app calls (see get_swap_amount_out_scaled).
+
+    Parameters:
+    transaction_group (algofi_amm.v0.transaction_group.TransactionGroup): The swap's signed and submitted transactions
+    algod_client (algod.AlgodClient): Algod client the swap was submitted with
+    account (Account): The account that carried out the swap
 
-    return amount
+    Returns:
+    int: The amount received, or None if it could not be found
+    """
+    return get_swap_amount_out_scaled(transaction_group.signed_transactions, algod_client, account)
+
+
+def get_pact_swap_amount_out_scaled(signed_group: List[Any], algod_client: algod.AlgodClient, account: Account) -> int:
+    """Get the amount of the asset out (scaled to its decimals) that a Pact swap actually sent to the account.
+
+    Parameters:
+    signed_group (List[algosdk.future.transaction.SignedTransaction]): The swap's signed and submitted transactions
+    algod_client (algod.AlgodClient): Algod client the swap was submitted with
+    account (Account): The account that carried out the swap
+
+    Returns:
+    int: The amount received, or None if it could not be found
+    """
+    return get_swap_amount_out_scaled(signed_group, algod_client, account)
 
 
 def get_asa_balance(address: str, asset_id: int, algod_client: algod.AlgodClient) -> int:
-    account_info = algod_client.account_info(address)
-    assets = account_info.get("assets")
-    balance = 0
+    # Ask algod for just this asset's holding rather than all of the account's details.
+    try:
+        asset_info = algod_client.account_asset_info(address, asset_id)
+    except AlgodHTTPError as e:
+        # algod responds with a 404 when the account hasn't opted in to the asset.
+        if e.code == 404:
+            return 0
+        raise
+
+    return asset_info.get("asset-holding", {}).get("amount", 0)
+
+
+def wait_for_new_round(algod_client: algod.AlgodClient, last_round: int | None = None) -> int:
+    """Wait until the network has committed a round after the given one, and return the latest round.
 
-    for asset in assets:
-        if asset.get("asset-id") == asset_id:
-            balance = asset.get("amount")
-            break
+    Prices on the DEXs can only change when a new round is committed, so the bots wait for one before checking
+    again rather than sleeping for a fixed time. algod holds the request open until the round is committed.
 
-    return balance
+    Parameters:
+    algod_client (algod.AlgodClient): Algod client to ask
+    last_round (int | None): The round to wait to get past. Defaults to the network's current round.
+
+    Returns:
+    int
+    """
+    if last_round is None:
+        last_round = algod_client.status()["last-round"]
+
+    return algod_client.status_after_block(last_round)["last-round"]
+
+
+def get_backoff_delay(failures: int, base_delay: float = 0.25, max_delay: float = 60.0) -> float:
+    """Get how long (in seconds) to wait before trying again after the given number of failures in a row.
+
+    Parameters:
+    failures (int): How many times in a row it has failed
+    base_delay (float): How long to wait after the first failure
+    max_delay (float): The longest to ever wait
+
+    Returns:
+    float
+    """
+    return min(max_delay, base_delay * 2**(failures - 1))
+
+
+def wait_for_transaction_confirmation(algod_client: algod.AlgodClient, tx_id: str, timeout: float = 60.0,
+                                      poll_interval: float = 0.2) -> Dict[str, Any]:
+    """Wait for a transaction to be confirmed and return its details.
+
+    algosdk's wait_for_confirmation only checks once per round. This checks every `poll_interval` seconds instead,
+    so we find out about the confirmation (and can get on with the next swap) as soon as possible.
+
+    Parameters:
+    algod_client (algod.AlgodClient): Algod client the transaction was sent with
+    tx_id (str): ID of the transaction
+    timeout (float): How long (in seconds) to wait for the transaction to be confirmed
+    poll_interval (float): How long (in seconds) to wait between checks
+
+    Returns:
+    Dict[str, Any]: The transaction's pending transaction info
+    """
+    deadline = time.monotonic() + timeout
+
+    while True:
+        tx_info = algod_client.pending_transaction_info(tx_id)
+        if tx_info.get("confirmed-round", 0) > 0:
+            return tx_info
+        elif tx_info.get("pool-error"):
+            raise AlgoTradeBotError(f"Transaction {tx_id} was rejected: {tx_info['pool-error']}")
+        elif time.monotonic() >= deadline:
+            raise AlgoTradeBotError(f"Transaction {tx_id} was not confirmed within {timeout} seconds")
+
+        time.sleep(poll_interval)